@@ -1,5 +1,7 @@
+from django import forms
 from django.contrib import admin
 from .models import Appointment, AppointmentImage
+from .occupancy import has_conflict
 from django.utils.html import format_html
 
 class AppointmentImageInline(admin.StackedInline):
@@ -13,6 +15,24 @@ class AppointmentImageInline(admin.StackedInline):
         return "No image"
     preview.short_description = "Preview"
 
+class AppointmentAdminForm(forms.ModelForm):
+    class Meta:
+        model = Appointment
+        fields = "__all__"
+
+    def clean(self):
+        # Ô thời gian được ghi khi lưu (doctors.signals); kiểm tra trước để báo lỗi trên form thay vì lỗi 500
+        data = super().clean()
+        doctor, start, end = data.get("doctor"), data.get("start_at"), data.get("end_at")
+        if doctor and start and end and data.get("status") != Appointment.Status.CANCELLED:
+            if end <= start:
+                raise forms.ValidationError("end_at phải lớn hơn start_at.")
+            candidate = Appointment(pk=self.instance.pk, doctor=doctor, room=data.get("room"), start_at=start, end_at=end)
+            if has_conflict(candidate, doctor.booking_buffer_minutes):
+                raise forms.ValidationError("Khung giờ trùng với lịch hẹn hoặc lượt giữ chỗ khác của bác sĩ hoặc phòng.")
+        return data
+
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
+    form = AppointmentAdminForm
     inlines = [AppointmentImageInline]
@@ -1,7 +1,6 @@
 from datetime import timedelta, date as date_cls
 
 from django.conf import settings
-from django.db import transaction
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from django.shortcuts import get_object_or_404
@@ -13,13 +12,45 @@ from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .locks import booking_lock
 from .models import Appointment, AppointmentImage
+from .occupancy import CellConflict, claim_hold, hold_slot
 from .serializers import (
     AppointmentSerializer,
     AppointmentCreateSerializer,
     AppointmentImageSerializer,
+    SlotHoldSerializer,
     _ensure_within_availability_and_grid,
+    booking_alternatives,
 )
+from doctors.scheduling import batched_schedule_changes
+
+def _doctor_busy(doctor_id, start, end, buffer, exclude_pk=None):
+    qs = (
+        Appointment.objects
+        .filter(doctor_id=doctor_id)
+        .exclude(status=Appointment.Status.CANCELLED)
+        .filter(start_at__lt=end + buffer, end_at__gt=start - buffer)
+    )
+    if exclude_pk is not None:
+        qs = qs.exclude(pk=exclude_pk)
+    return qs.exists()
+
+def _room_taken(room_id, doctor_id, start, end, exclude_pk=None):
+    """Phòng đã có bác sĩ khác dùng trong [start, end)? Một truy vấn range trên index (room, start_at)."""
+    if room_id is None:
+        return False
+    qs = (
+        Appointment.objects
+        .filter(room_id=room_id, start_at__lt=end, start_at__gt=start - timedelta(days=1), end_at__gt=start)
+        .exclude(doctor_id=doctor_id)
+        .exclude(status=Appointment.Status.CANCELLED)
+    )
+    if exclude_pk is not None:
+        qs = qs.exclude(pk=exclude_pk)
+    return qs.exists()
+
+ROOM_TAKEN_MESSAGE = "Phòng khám đã có bác sĩ khác sử dụng trong khung giờ này."
 
 class AppointmentViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
@@ -74,6 +105,8 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         return qs.order_by("-start_at")
 
     def get_serializer_class(self):
+        if self.action == "holds":
+            return SlotHoldSerializer
         return AppointmentCreateSerializer if self.action == "create" else AppointmentSerializer
 
     def perform_create(self, serializer):
@@ -90,22 +123,22 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if start < timezone.now():
             raise ValidationError("Không được đặt lịch trong quá khứ.")
 
-        buffer = timedelta(minutes=getattr(settings, "APPOINTMENT_BUFFER_MINUTES", 0))
+        buffer = timedelta(minutes=doctor.booking_buffer_minutes)
 
-        with transaction.atomic():
-            clash = (
-                Appointment.objects.select_for_update()
-                .filter(doctor=doctor)
-                .exclude(status=Appointment.Status.CANCELLED)
-                .filter(start_at__lt=end + buffer, end_at__gt=start - buffer)
-                .exists()
+        # Trùng giờ được chặn bởi ràng buộc unique của AppointmentCell (ghi trong post_save), không khóa dải lịch hẹn.
+        # Cập nhật cache/DoctorSlot chạy sau khi commit để transaction chỉ gồm các lệnh INSERT.
+        try:
+            with batched_schedule_changes(), booking_lock(doctor.pk, doctor.room_id):
+                # Lượt giữ chỗ của chính bệnh nhân được nhả trong cùng transaction để lịch hẹn chiếm lại các ô đó
+                claim_hold(user.patient_profile, doctor)
+                appt = serializer.save(patient=user.patient_profile, room_id=doctor.room_id, start_at=start, end_at=end, status=Appointment.Status.PENDING)
+        except CellConflict:
+            if _room_taken(doctor.room_id, doctor.pk, start, end) and not _doctor_busy(doctor.pk, start, end, buffer):
+                raise ValidationError(ROOM_TAKEN_MESSAGE)
+            raise serializer.clash_error(
+                f"Khung giờ đã bận (bao gồm buffer {buffer.seconds // 60} phút).", start, end
             )
-            if clash:
-                raise ValidationError(
-                    f"Khung giờ đã bận (bao gồm buffer {buffer.seconds // 60} phút)."
-                )
-
-            self._created_instance = serializer.save(patient=user.patient_profile, start_at=start, end_at=end, status=Appointment.Status.PENDING)
+        self._created_instance = appt
 
     def create(self, request, *args, **kwargs):
         ser = self.get_serializer(data=request.data)
@@ -115,6 +148,39 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(ser.data)
         return Response(detail, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(detail=False, methods=["post"], url_path="holds")
+    def holds(self, request):
+        """
+        Giữ chỗ một khung giờ trong SLOT_HOLD_MINUTES phút. Khi chính bệnh nhân này đặt lịch với bác sĩ,
+        lượt giữ được nhả trong cùng transaction (không cần gửi token).
+        """
+        user = request.user
+        if not hasattr(user, "patient_profile"):
+            raise PermissionDenied("Chỉ bệnh nhân mới được giữ chỗ.")
+
+        ser = self.get_serializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        start = self._normalize_dt(ser.validated_data["start_at"])
+        end = self._normalize_dt(ser.validated_data["end_at"])
+        doctor = ser.validated_data["doctor"]
+
+        try:
+            with booking_lock(doctor.pk, doctor.room_id):
+                hold = hold_slot(doctor, user.patient_profile, start, end)
+        except CellConflict:
+            raise ser.clash_error("Khung giờ đang được giữ hoặc đã có người đặt. Vui lòng chọn giờ khác.", start, end)
+
+        return Response(
+            {
+                "token": hold.token,
+                "doctor": doctor.pk,
+                "start_at": timezone.localtime(hold.start_at).isoformat(),
+                "end_at": timezone.localtime(hold.end_at).isoformat(),
+                "expires_at": timezone.localtime(hold.expires_at).isoformat(),
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
     @action(detail=True, methods=["post"])
     def confirm(self, request, pk=None):
         appt = get_object_or_404(self.get_queryset(), pk=pk)
@@ -203,29 +269,31 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if not is_party:
             return Response({"detail": "Không có quyền"}, status=403)
 
-        _ensure_within_availability_and_grid(appt.doctor, new_start, new_end)
+        grid = _ensure_within_availability_and_grid(appt.doctor, new_start, new_end)
 
-        buffer = timedelta(minutes=getattr(settings, "APPOINTMENT_BUFFER_MINUTES", 0))
+        buffer = timedelta(minutes=appt.doctor.booking_buffer_minutes)
 
-        with transaction.atomic():
-            clash = (
-                Appointment.objects.select_for_update()
-                .filter(doctor=appt.doctor)
-                .exclude(pk=appt.pk)
-                .exclude(status=Appointment.Status.CANCELLED)
-                .filter(start_at__lt=new_end + buffer, end_at__gt=new_start - buffer)
-                .exists()
+        room_id = appt.doctor.room_id
+        old = (appt.room_id, appt.start_at, appt.end_at, appt.status)
+        try:
+            with batched_schedule_changes(), booking_lock(appt.doctor_id, room_id):
+                appt.room_id = room_id
+                appt.start_at = new_start
+                appt.end_at = new_end
+                appt.status = Appointment.Status.PENDING
+                appt.save()
+        except CellConflict:
+            appt.room_id, appt.start_at, appt.end_at, appt.status = old
+            if (_room_taken(room_id, appt.doctor_id, new_start, new_end, exclude_pk=appt.pk)
+                    and not _doctor_busy(appt.doctor_id, new_start, new_end, buffer, exclude_pk=appt.pk)):
+                return Response({"detail": ROOM_TAKEN_MESSAGE}, status=400)
+            return Response(
+                {
+                    "detail": f"Khung giờ đã bận (bao gồm buffer {buffer.seconds // 60} phút).",
+                    **booking_alternatives(appt.doctor, grid, new_start, new_end),
+                },
+                status=400,
             )
-            if clash:
-                return Response(
-                    {"detail": f"Khung giờ đã bận (bao gồm buffer {buffer.seconds // 60} phút)."},
-                    status=400,
-                )
-
-            appt.start_at = new_start
-            appt.end_at = new_end
-            appt.status = Appointment.Status.PENDING
-            appt.save()
 
         return Response(AppointmentSerializer(appt).data)
     
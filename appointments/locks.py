@@ -0,0 +1,155 @@
+# appointments/locks.py
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection, transaction
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException
+
+from doctors.models import Doctor, Room
+
+
+class BookingLockTimeout(APIException):
+    status_code = 503
+    default_detail = "Hệ thống đang xử lý lịch hẹn khác của bác sĩ này, vui lòng thử lại."
+    default_code = "booking_lock_timeout"
+
+
+class NullLockBackend:
+    """Không khóa (mặc định): ràng buộc unique của AppointmentCell đã chặn trùng giờ, chỉ mở transaction."""
+    transactional = True
+
+    def acquire(self, keys, timeout):
+        pass
+
+    def release(self, keys):
+        pass
+
+
+class RowLockBackend:
+    """
+    Khóa dòng Doctor (và Room) bằng SELECT ... FOR UPDATE theo khóa chính: chỉ khóa đúng một dòng,
+    không có gap lock trên index lịch hẹn. Khóa tự nhả khi transaction kết thúc.
+    Dùng NOWAIT rồi thử lại đến hết timeout, để thời gian chờ không phụ thuộc innodb_lock_wait_timeout
+    (cần MySQL 8+/PostgreSQL; SQLite bỏ qua FOR UPDATE).
+    """
+    transactional = True
+    models = {"doctor": Doctor, "room": Room}
+    poll_interval = 0.05
+
+    def acquire(self, keys, timeout):
+        deadline = time.monotonic() + timeout
+        for kind, pk in keys:
+            qs = self.models[kind].objects.select_for_update(nowait=True).filter(pk=pk).values_list("pk", flat=True)
+            while True:
+                try:
+                    # Savepoint riêng: trên PostgreSQL lỗi NOWAIT làm hỏng cả transaction nếu không rollback về đây
+                    with transaction.atomic():
+                        list(qs)
+                    break
+                except OperationalError:
+                    if time.monotonic() >= deadline:
+                        raise BookingLockTimeout()
+                    time.sleep(self.poll_interval)
+
+    def release(self, keys):
+        pass
+
+
+class MySQLLockBackend:
+    """GET_LOCK/RELEASE_LOCK của MySQL: khóa theo tên, không chạm vào bảng nào."""
+    transactional = False
+
+    def __init__(self):
+        if connection.vendor != "mysql":
+            raise ImproperlyConfigured("APPOINTMENT_LOCK_BACKEND='mysql' chỉ dùng được với MySQL.")
+
+    @staticmethod
+    def _name(kind, pk):
+        return f"{settings.DATABASES['default'].get('NAME') or 'medibook'}:booking:{kind}:{pk}"
+
+    def acquire(self, keys, timeout):
+        acquired = []
+        try:
+            with connection.cursor() as cursor:
+                for kind, pk in keys:
+                    cursor.execute("SELECT GET_LOCK(%s, %s)", [self._name(kind, pk), timeout])
+                    if cursor.fetchone()[0] != 1:
+                        raise BookingLockTimeout()
+                    acquired.append((kind, pk))
+        except BaseException:
+            self.release(acquired)
+            raise
+
+    def release(self, keys):
+        with connection.cursor() as cursor:
+            for kind, pk in reversed(keys):
+                cursor.execute("SELECT RELEASE_LOCK(%s)", [self._name(kind, pk)])
+
+
+class LocalLockBackend:
+    """threading.Lock trong tiến trình, cho môi trường dev/test một tiến trình (không có tác dụng giữa các worker)."""
+    transactional = False
+    _guard = threading.Lock()
+    _locks = {}
+
+    def _lock(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def acquire(self, keys, timeout):
+        acquired = []
+        for key in keys:
+            if not self._lock(key).acquire(timeout=timeout):
+                self.release(acquired)
+                raise BookingLockTimeout()
+            acquired.append(key)
+
+    def release(self, keys):
+        for key in reversed(keys):
+            self._lock(key).release()
+
+
+BACKENDS = {
+    "none": NullLockBackend,
+    "row": RowLockBackend,
+    "mysql": MySQLLockBackend,
+    "local": LocalLockBackend,
+}
+
+
+def get_backend():
+    name = getattr(settings, "APPOINTMENT_LOCK_BACKEND", "none")
+    cls = BACKENDS.get(name) or import_string(name)
+    return cls()
+
+
+@contextmanager
+def booking_lock(doctor_id, room_id=None):
+    """
+    Bọc việc đặt/dời/giữ lịch trong transaction.atomic(). Trùng giờ luôn do ô AppointmentCell chặn; khi bật
+    một backend khóa, các lượt của cùng bác sĩ (và cùng phòng) xếp hàng thay vì cùng ghi rồi đụng ràng buộc
+    unique, còn bác sĩ khác nhau không chờ nhau. Các khóa luôn lấy theo cùng thứ tự để tránh deadlock;
+    khóa không theo transaction (GET_LOCK, local) chỉ nhả sau khi transaction đã commit hoặc rollback.
+    """
+    keys = [("doctor", doctor_id)]
+    if room_id is not None:
+        keys.append(("room", room_id))
+    backend = get_backend()
+    timeout = getattr(settings, "APPOINTMENT_LOCK_TIMEOUT", 10)
+
+    if backend.transactional:
+        with transaction.atomic():
+            backend.acquire(keys, timeout)
+            yield
+        return
+
+    backend.acquire(keys, timeout)
+    try:
+        with transaction.atomic():
+            yield
+    finally:
+        backend.release(keys)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from appointments.occupancy import purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Xóa các lượt giữ chỗ đã hết hạn và các ô AppointmentCell đã trôi qua. "
+        "Nên chạy định kỳ (vài phút một lần); lượt giữ hết hạn vốn đã bị bỏ qua lúc đọc."
+    )
+
+    def handle(self, *args, **options):
+        holds, cells = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Đã xóa {holds} lượt giữ chỗ hết hạn và {cells} ô đã qua."))
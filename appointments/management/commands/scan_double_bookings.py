@@ -0,0 +1,249 @@
+import json
+import multiprocessing
+from collections import defaultdict
+from datetime import date as date_cls, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from appointments.models import Appointment
+from appointments.serializers import _local_minutes
+from doctors.models import Doctor, DoctorAvailability, DoctorDayOff, Room
+from doctors.scheduling import _mins, clinic_closures, windows_on
+
+
+def _iso(dt):
+    return timezone.localtime(dt).isoformat()
+
+
+def _blocked(rows, s_m, e_m):
+    """Dòng nghỉ (DoctorDayOff/ClinicClosure) đầu tiên chạm vào [s_m, e_m), hoặc None."""
+    for row in rows:
+        if row.start_time is None and row.end_time is None:
+            return row
+        if row.start_time and row.end_time and _mins(row.start_time) < e_m and s_m < _mins(row.end_time):
+            return row
+    return None
+
+
+def scan_doctors(doctor_ids, since=None, until=None, buffer_minutes=0):
+    """
+    Quét lịch hẹn của một nhóm bác sĩ theo thứ tự (doctor, start_at) trong một lượt tuyến tính.
+    Với mỗi bác sĩ chỉ giữ lịch hẹn có giờ kết thúc xa nhất đã gặp (sweep line), nên bộ nhớ
+    không phụ thuộc số lịch hẹn. buffer_minutes là giá trị mặc định cho bác sĩ không đặt
+    Doctor.buffer_minutes. Trả về (danh sách vấn đề, số lịch hẹn đã quét).
+    """
+    buffers = dict(Doctor.objects.filter(pk__in=doctor_ids).values_list("pk", "buffer_minutes"))
+    closures = clinic_closures()
+
+    avails = defaultdict(list)
+    for av in DoctorAvailability.objects.filter(doctor_id__in=doctor_ids, is_active=True):
+        avails[av.doctor_id].append(av)
+
+    day_offs = defaultdict(lambda: defaultdict(list))
+    offs = DoctorDayOff.objects.filter(doctor_id__in=doctor_ids)
+    if since:
+        offs = offs.filter(date__gte=since)
+    if until:
+        offs = offs.filter(date__lte=until)
+    for off in offs:
+        day_offs[off.doctor_id][off.date].append(off)
+
+    rows = (
+        Appointment.objects.filter(doctor_id__in=doctor_ids, start_at__isnull=False, end_at__isnull=False)
+        .exclude(status=Appointment.Status.CANCELLED)
+        .order_by("doctor_id", "start_at", "id")
+        .values_list("id", "doctor_id", "start_at", "end_at")
+    )
+    if since:
+        rows = rows.filter(start_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    if until:
+        rows = rows.filter(start_at__lt=timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min)))
+
+    issues = []
+    scanned = 0
+    current_doctor = None
+    reach = None  # (end_at, id, start_at) của lịch hẹn kết thúc muộn nhất của bác sĩ hiện tại
+
+    for appt_id, doctor_id, start_at, end_at in rows.iterator(chunk_size=2000):
+        scanned += 1
+        if doctor_id != current_doctor:
+            current_doctor = doctor_id
+            reach = None
+            doctor_buffer = buffers.get(doctor_id)
+            if doctor_buffer is None:
+                doctor_buffer = buffer_minutes
+            buffer = timedelta(minutes=doctor_buffer)
+
+        base = {"doctor_id": doctor_id, "appointment_id": appt_id, "start_at": _iso(start_at), "end_at": _iso(end_at)}
+
+        if reach is not None:
+            reach_end, reach_id, reach_start = reach
+            if start_at < reach_end:
+                issues.append({**base, "type": "overlap", "other_id": reach_id,
+                               "other_start_at": _iso(reach_start), "other_end_at": _iso(reach_end)})
+            elif start_at < reach_end + buffer:
+                issues.append({**base, "type": "buffer", "other_id": reach_id,
+                               "gap_minutes": int((start_at - reach_end).total_seconds() // 60),
+                               "buffer_minutes": doctor_buffer})
+        if reach is None or end_at > reach[0]:
+            reach = (end_at, appt_id, start_at)
+
+        s, e, s_m, e_m = _local_minutes(start_at, end_at)
+        day = s.date()
+        reason = None
+        if day != e.date():
+            reason = "multi_day"
+        elif not any(w0 <= s_m and e_m <= w1 for w0, w1, _ in windows_on(avails[doctor_id], day)):
+            reason = "no_window"
+        elif _blocked(day_offs[doctor_id].get(day, ()), s_m, e_m):
+            reason = "day_off"
+        elif _blocked(closures.get(day, ()), s_m, e_m):
+            reason = "clinic_closure"
+        if reason:
+            issues.append({**base, "type": "outside_availability", "reason": reason})
+
+    return issues, scanned
+
+
+def scan_rooms(room_ids, since=None, until=None):
+    """
+    Quét theo (phòng, start_at) để tìm hai lịch hẹn của hai bác sĩ khác nhau dùng cùng phòng trùng giờ.
+    Lịch trùng của cùng một bác sĩ đã được scan_doctors báo (overlap) nên bỏ qua. Ngoài lịch kết thúc muộn
+    nhất, giữ thêm lịch kết thúc muộn nhất của bác sĩ khác, vì lịch sau cùng bác sĩ với lịch muộn nhất
+    vẫn có thể trùng với lịch của bác sĩ khác. Trả về (danh sách vấn đề, số lịch hẹn đã quét).
+    """
+    rows = (
+        Appointment.objects.filter(room_id__in=room_ids, start_at__isnull=False, end_at__isnull=False)
+        .exclude(status=Appointment.Status.CANCELLED)
+        .order_by("room_id", "start_at", "id")
+        .values_list("id", "room_id", "doctor_id", "start_at", "end_at")
+    )
+    if since:
+        rows = rows.filter(start_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    if until:
+        rows = rows.filter(start_at__lt=timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min)))
+
+    issues = []
+    scanned = 0
+    current_room = None
+    reach = other = None  # (end_at, id, start_at, doctor_id)
+
+    for appt_id, room_id, doctor_id, start_at, end_at in rows.iterator(chunk_size=2000):
+        scanned += 1
+        if room_id != current_room:
+            current_room = room_id
+            reach = other = None
+
+        rival = reach if reach is None or reach[3] != doctor_id else other
+        if rival is not None and start_at < rival[0]:
+            issues.append({
+                "doctor_id": doctor_id, "appointment_id": appt_id, "start_at": _iso(start_at), "end_at": _iso(end_at),
+                "type": "room_overlap", "room_id": room_id, "other_id": rival[1], "other_doctor_id": rival[3],
+                "other_start_at": _iso(rival[2]), "other_end_at": _iso(rival[0]),
+            })
+
+        item = (end_at, appt_id, start_at, doctor_id)
+        if reach is None or end_at > reach[0]:
+            if reach is not None and reach[3] != doctor_id:
+                other = reach
+            reach = item
+        elif reach[3] != doctor_id and (other is None or end_at > other[0]):
+            other = item
+
+    return issues, scanned
+
+
+def _scan(kind, args):
+    if kind == "rooms":
+        # Lịch hẹn đã được đếm ở lượt quét theo bác sĩ nên không cộng vào "scanned" lần nữa
+        return scan_rooms(*args)[0], 0
+    return scan_doctors(*args)
+
+
+def _worker(task):
+    # Mỗi tiến trình con cần kết nối DB riêng, không dùng lại kết nối kế thừa từ tiến trình cha
+    connections.close_all()
+    return _scan(*task)
+
+
+class Command(BaseCommand):
+    help = (
+        "Quét toàn bộ lịch hẹn chưa hủy theo (bác sĩ, giờ bắt đầu) để tìm lịch trùng giờ, vi phạm buffer "
+        "(Doctor.buffer_minutes hoặc APPOINTMENT_BUFFER_MINUTES), lịch nằm ngoài giờ làm việc và hai bác sĩ trùng phòng. "
+        "Kết quả xuất dạng JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Chỉ quét lịch bắt đầu từ ngày này (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Chỉ quét lịch bắt đầu đến hết ngày này (YYYY-MM-DD).")
+        parser.add_argument("--batch-doctors", type=int, default=50, help="Số bác sĩ mỗi lượt truy vấn.")
+        parser.add_argument("--workers", type=int, default=1, help="Số tiến trình quét song song theo nhóm bác sĩ.")
+        parser.add_argument("--output", help="Ghi JSON ra file thay vì stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            since = date_cls.fromisoformat(options["since"]) if options["since"] else None
+            until = date_cls.fromisoformat(options["until"]) if options["until"] else None
+        except ValueError:
+            raise CommandError("Ngày không hợp lệ, cần dạng YYYY-MM-DD.")
+
+        buffer_minutes = getattr(settings, "APPOINTMENT_BUFFER_MINUTES", 0)
+        size = max(1, options["batch_doctors"])
+        doctor_ids = list(Doctor.objects.order_by("pk").values_list("pk", flat=True))
+        room_ids = list(Room.objects.order_by("pk").values_list("pk", flat=True))
+        batches = [("doctors", (doctor_ids[i:i + size], since, until, buffer_minutes)) for i in range(0, len(doctor_ids), size)]
+        batches += [("rooms", (room_ids[i:i + size], since, until)) for i in range(0, len(room_ids), size)]
+
+        if options["output"]:
+            out = open(options["output"], "w", encoding="utf-8")
+            write = out.write
+        else:
+            out = None
+            write = lambda text: self.stdout.write(text, ending="")
+        counts = defaultdict(int)
+        scanned = 0
+        first = True
+        try:
+            # JSON được ghi dần theo từng nhóm bác sĩ để không phải giữ toàn bộ kết quả trong bộ nhớ
+            write('{"issues": [')
+            if options["workers"] > 1 and len(batches) > 1:
+                connections.close_all()
+                with multiprocessing.get_context("fork").Pool(options["workers"]) as pool:
+                    results = pool.imap(_worker, batches)
+                    for issues, n in results:
+                        scanned += n
+                        first = self._write_issues(write, issues, counts, first)
+            else:
+                for batch in batches:
+                    issues, n = _scan(*batch)
+                    scanned += n
+                    first = self._write_issues(write, issues, counts, first)
+
+            summary = {
+                "scanned": scanned,
+                "doctors": len(doctor_ids),
+                "rooms": len(room_ids),
+                "buffer_minutes": buffer_minutes,
+                "since": str(since) if since else None,
+                "until": str(until) if until else None,
+                "counts": dict(counts),
+            }
+            write('\n], "summary": ' + json.dumps(summary, ensure_ascii=False) + "}\n")
+        finally:
+            if out is not None:
+                out.close()
+
+        if options["output"]:
+            total = sum(counts.values())
+            style = self.style.WARNING if total else self.style.SUCCESS
+            self.stdout.write(style(f"Đã quét {scanned} lịch hẹn, phát hiện {total} vấn đề. Kết quả: {options['output']}"))
+
+    def _write_issues(self, write, issues, counts, first):
+        for issue in issues:
+            counts[issue["type"]] += 1
+            write(("\n" if first else ",\n") + json.dumps(issue, ensure_ascii=False))
+            first = False
+        return first
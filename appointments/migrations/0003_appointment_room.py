@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+def fill_rooms(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    Doctor = apps.get_model('doctors', 'Doctor')
+    Appointment.objects.filter(end_at__gt=timezone.now()).exclude(status='CANCELLED').update(
+        room=Subquery(Doctor.objects.filter(pk=OuterRef('doctor_id')).values('room')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_remove_appointment_reason_appointment_note_and_more'),
+        ('doctors', '0018_room'),
+        ('patients', '0003_alter_patient_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='room',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='doctors.room'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['room', 'start_at'], name='appointment_room_id_c8e597_idx'),
+        ),
+        migrations.RunPython(fill_rooms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:23
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_cells(apps, schema_editor):
+    # Chỉ cần ô cho lịch hẹn chưa kết thúc; lịch cũ chồng nhau (nếu có) bị bỏ qua nhờ ignore_conflicts
+    Appointment = apps.get_model('appointments', 'Appointment')
+    AppointmentCell = apps.get_model('appointments', 'AppointmentCell')
+    size = getattr(settings, 'APPOINTMENT_CELL_MINUTES', 5) * 60
+    default_buffer = getattr(settings, 'APPOINTMENT_BUFFER_MINUTES', 0)
+
+    def starts(start, end):
+        first = int(start.timestamp()) // size * size
+        last = -(-int(end.timestamp()) // size) * size
+        return [datetime.fromtimestamp(t, dt_timezone.utc) for t in range(first, last, size)]
+
+    appts = (
+        Appointment.objects.filter(end_at__gt=timezone.now(), start_at__isnull=False, doctor__isnull=False)
+        .exclude(status='CANCELLED')
+        .select_related('doctor')
+        .order_by('start_at')
+    )
+    cells = []
+    for appt in appts.iterator():
+        core = starts(appt.start_at, appt.end_at)
+        cells += [
+            AppointmentCell(appointment_id=appt.pk, doctor_id=appt.doctor_id, room_id=appt.room_id, cell_start=c)
+            for c in core
+        ]
+        buffer = appt.doctor.buffer_minutes if appt.doctor.buffer_minutes is not None else default_buffer
+        if buffer:
+            cells += [
+                AppointmentCell(appointment_id=appt.pk, doctor_id=appt.doctor_id, cell_start=c)
+                for c in starts(appt.end_at, appt.end_at + timedelta(minutes=buffer))
+                if c not in core
+            ]
+        if len(cells) >= 5000:
+            AppointmentCell.objects.bulk_create(cells, ignore_conflicts=True)
+            cells = []
+    AppointmentCell.objects.bulk_create(cells, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_appointment_room'),
+        ('doctors', '0022_doctor_buffer_minutes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell_start', models.DateTimeField()),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cells', to='appointments.appointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='doctors.doctor')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='doctors.room')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'cell_start'), name='appointment_cell_doctor_uniq'), models.UniqueConstraint(fields=('room', 'cell_start'), name='appointment_cell_room_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_cells, migrations.RunPython.noop),
+    ]
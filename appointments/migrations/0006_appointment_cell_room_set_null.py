@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_slot_hold'),
+        ('doctors', '0022_doctor_buffer_minutes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointmentcell',
+            name='room',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='doctors.room'),
+        ),
+    ]
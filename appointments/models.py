@@ -1,7 +1,9 @@
-from django.db import models
+import secrets
+
+from django.db import models, transaction
 from django.utils import timezone
 
-from doctors.models import Doctor
+from doctors.models import Doctor, Room
 from patients.models import Patient
 
 class Appointment(models.Model):
@@ -12,6 +14,7 @@ class Appointment(models.Model):
         CANCELLED = "CANCELLED", "Cancelled"
 
     doctor     = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, blank=True, related_name="appointments")
+    room       = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True, related_name="appointments")
     patient    = models.ForeignKey(Patient, on_delete=models.SET_NULL, null=True, blank=True, related_name="appointments")
     start_at = models.DateTimeField(null=True, blank=True)
     end_at   = models.DateTimeField(null=True, blank=True)
@@ -21,6 +24,13 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ["-start_at"]
+        indexes = [models.Index(fields=["room", "start_at"])]
+
+    def save(self, *args, **kwargs):
+        # Ô AppointmentCell được ghi trong post_save (doctors.signals); nếu trùng (CellConflict)
+        # thì dòng lịch hẹn cũng phải rollback, kể cả khi người gọi không mở transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         doctor_name = self.doctor.user.full_name if self.doctor else "Unknown Doctor"
@@ -30,6 +40,48 @@ class Appointment(models.Model):
             return f"{patient_name} with {doctor_name} on {start_local:%H:%M %d-%m-%Y}"
         return f"{patient_name} with {doctor_name}"
 
+def _hold_token():
+    return secrets.token_urlsafe(24)
+
+class SlotHold(models.Model):
+    """
+    Giữ chỗ tạm một khung giờ trong lúc bệnh nhân điền form đặt lịch. Hết hạn theo expires_at:
+    lúc đọc chỉ cần lọc expires_at > now, dòng hết hạn được xóa bởi lệnh purge_slot_holds.
+    """
+    token = models.CharField(max_length=64, unique=True, default=_hold_token)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name="slot_holds")
+    room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="slot_holds")
+    start_at = models.DateTimeField()
+    end_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["doctor", "start_at"])]
+
+    def __str__(self):
+        return f"Hold {self.doctor_id} {self.start_at:%H:%M %d-%m-%Y} until {self.expires_at:%H:%M}"
+
+class AppointmentCell(models.Model):
+    """
+    Một ô thời gian (APPOINTMENT_CELL_MINUTES phút) mà lịch hẹn (hoặc lượt giữ chỗ) chiếm của bác sĩ,
+    gồm cả buffer sau lịch. Ràng buộc unique trên (doctor, cell_start) và (room, cell_start) khiến hai lịch
+    trùng giờ không thể cùng được ghi; ô buffer để room trống để không chặn phòng cho bác sĩ khác.
+    """
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, null=True, blank=True, related_name="cells")
+    hold = models.ForeignKey(SlotHold, on_delete=models.CASCADE, null=True, blank=True, related_name="cells")
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name="+")
+    # Xóa phòng chỉ bỏ phần chặn phòng; ô vẫn là chốt chặn trùng giờ của bác sĩ
+    room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    cell_start = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["doctor", "cell_start"], name="appointment_cell_doctor_uniq"),
+            models.UniqueConstraint(fields=["room", "cell_start"], name="appointment_cell_room_uniq"),
+        ]
+
 class AppointmentImage(models.Model):
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to="appointment_images/")
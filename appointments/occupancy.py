@@ -0,0 +1,228 @@
+# appointments/occupancy.py
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from doctors.models import Room
+from .models import Appointment, AppointmentCell, SlotHold
+
+
+class CellConflict(Exception):
+    """Một ô thời gian của lịch hẹn đã thuộc về lịch khác của bác sĩ (hoặc của phòng)."""
+
+
+def _cell_seconds():
+    return getattr(settings, "APPOINTMENT_CELL_MINUTES", 5) * 60
+
+
+def cell_starts(start, end):
+    """Đầu các ô phủ [start, end), làm tròn ra ngoài theo lưới ô tính từ epoch (UTC)."""
+    size = _cell_seconds()
+    first = int(start.timestamp()) // size * size
+    last = -(-int(end.timestamp()) // size) * size
+    return [datetime.fromtimestamp(t, dt_timezone.utc) for t in range(first, last, size)]
+
+
+def build_cells(owner, buffer_minutes=0):
+    """Các ô của một Appointment hoặc SlotHold: [start, end) kèm phòng, rồi [end, end + buffer) không kèm phòng."""
+    field = "hold" if isinstance(owner, SlotHold) else "appointment"
+    core = cell_starts(owner.start_at, owner.end_at)
+    cells = [
+        AppointmentCell(**{field: owner}, doctor_id=owner.doctor_id, room_id=owner.room_id, cell_start=c)
+        for c in core
+    ]
+    if buffer_minutes:
+        taken = set(core)
+        cells += [
+            AppointmentCell(**{field: owner}, doctor_id=owner.doctor_id, cell_start=c)
+            for c in cell_starts(owner.end_at, owner.end_at + timedelta(minutes=buffer_minutes))
+            if c not in taken
+        ]
+    return cells
+
+
+def _purge_expired_holds(cells):
+    """Xóa các lượt giữ chỗ đã hết hạn đang chiếm những ô này. Trả về True nếu có xóa."""
+    doctor_ids = {c.doctor_id for c in cells}
+    room_ids = {c.room_id for c in cells if c.room_id is not None}
+    starts = [c.cell_start for c in cells]
+    owners = Q(cells__doctor_id__in=doctor_ids)
+    if room_ids:
+        owners |= Q(cells__room_id__in=room_ids)
+    expired = SlotHold.objects.filter(
+        owners, expires_at__lte=timezone.now(), cells__cell_start__gte=min(starts), cells__cell_start__lte=max(starts),
+    ).values_list("pk", flat=True).distinct()
+    ids = list(expired)
+    if not ids:
+        return False
+    AppointmentCell.objects.filter(hold_id__in=ids).delete()
+    SlotHold.objects.filter(pk__in=ids).delete()
+    return True
+
+
+def occupy(owner, buffer_minutes=0):
+    """
+    Ghi các ô của lịch hẹn (hoặc lượt giữ chỗ) bằng một bulk_create. Trùng giờ được phát hiện bởi ràng buộc
+    unique (IntegrityError) thay vì quét và khóa dải lịch hẹn; khi đó toàn bộ ô của lịch này được bỏ qua.
+    Ô của lượt giữ chỗ đã hết hạn nhưng chưa bị dọn được xóa ngay lúc đó rồi thử lại một lần.
+    """
+    cells = build_cells(owner, buffer_minutes)
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                AppointmentCell.objects.bulk_create(cells)
+            return
+        except IntegrityError:
+            if attempt or not _purge_expired_holds(cells):
+                raise CellConflict()
+
+
+def release(appointment):
+    AppointmentCell.objects.filter(appointment=appointment).delete()
+
+
+def sync_cells(appointment):
+    """
+    Ghi lại ô của lịch hẹn theo trạng thái hiện tại; lịch đã hủy (hoặc thiếu bác sĩ/giờ) không giữ ô nào.
+    Gọi từ signal post_save của Appointment nên mọi đường lưu (API, admin, shell) đều đi qua đây.
+    QuerySet.update()/bulk_create() bỏ qua signal: sau các lệnh đó phải gọi hàm này hoặc rebuild_doctor_cells.
+    """
+    with transaction.atomic():
+        release(appointment)
+        if appointment.status == Appointment.Status.CANCELLED:
+            return
+        if not (appointment.doctor_id and appointment.start_at and appointment.end_at):
+            return
+        occupy(appointment, appointment.doctor.booking_buffer_minutes)
+
+
+def has_conflict(appointment, buffer_minutes=0):
+    """
+    Kiểm tra trước (ví dụ trong form admin) xem ô nào của lịch hẹn đã thuộc lịch hoặc lượt giữ còn hạn khác.
+    Chỉ để báo lỗi sớm; occupy() vẫn là chốt chặn.
+    """
+    cells = build_cells(appointment, buffer_minutes)
+    if not cells:
+        return False
+    taken = Q(doctor_id=appointment.doctor_id, cell_start__in=[c.cell_start for c in cells])
+    if appointment.room_id:
+        taken |= Q(room_id=appointment.room_id, cell_start__in=[c.cell_start for c in cells if c.room_id])
+    qs = AppointmentCell.objects.filter(taken).exclude(hold__expires_at__lte=timezone.now())
+    if appointment.pk:
+        qs = qs.exclude(appointment_id=appointment.pk)
+    return qs.exists()
+
+
+def hold_slot(doctor, patient, start, end):
+    """
+    Giữ chỗ [start, end) cho bệnh nhân trong SLOT_HOLD_MINUTES phút. Mỗi bệnh nhân chỉ giữ một chỗ:
+    lượt giữ trước đó (nếu có) được nhả trong cùng transaction. Ném CellConflict nếu khung giờ đã bị chiếm.
+    """
+    now = timezone.now()
+    minutes = getattr(settings, "SLOT_HOLD_MINUTES", 5)
+    with transaction.atomic():
+        previous = list(SlotHold.objects.filter(patient=patient).values_list("pk", flat=True))
+        if previous:
+            AppointmentCell.objects.filter(hold_id__in=previous).delete()
+            SlotHold.objects.filter(pk__in=previous).delete()
+        hold = SlotHold.objects.create(
+            doctor=doctor, room_id=doctor.room_id, patient=patient, start_at=start, end_at=end,
+            expires_at=now + timedelta(minutes=minutes),
+        )
+        occupy(hold, doctor.booking_buffer_minutes)
+    return hold
+
+
+def claim_hold(patient, doctor):
+    """
+    Nhả các lượt giữ chỗ của bệnh nhân với bác sĩ này (không cần token, không cần khớp giờ) để lịch hẹn của chính
+    họ không bị lượt giữ của mình chặn. Mỗi bệnh nhân chỉ có một lượt giữ nên không nhả nhầm của người khác.
+    Gọi trong transaction tạo lịch hẹn để khung giờ không bị trống ở giữa. Trả về True nếu có lượt giữ.
+    """
+    ids = list(SlotHold.objects.filter(patient=patient, doctor=doctor).values_list("pk", flat=True))
+    if not ids:
+        return False
+    AppointmentCell.objects.filter(hold_id__in=ids).delete()
+    SlotHold.objects.filter(pk__in=ids).delete()
+    return True
+
+
+def purge_expired(now=None):
+    """
+    Dọn định kỳ: xóa lượt giữ chỗ đã hết hạn và các ô đã trôi qua (không còn ảnh hưởng tới lịch mới).
+    Trả về (số lượt giữ, số ô) đã xóa.
+    """
+    now = now or timezone.now()
+    expired = SlotHold.objects.filter(expires_at__lte=now)
+    AppointmentCell.objects.filter(hold__in=expired).delete()
+    holds, _ = expired.delete()
+    cells, _ = AppointmentCell.objects.filter(cell_start__lt=now - timedelta(hours=1)).delete()
+    return holds, cells
+
+
+def rebuild_doctor_cells(doctor, move_room=False):
+    """
+    Ghi lại ô của các lịch hẹn chưa kết thúc theo buffer hiện tại của bác sĩ (sau khi buffer thay đổi).
+    move_room=True (bác sĩ đổi phòng) chuyển luôn các lịch hẹn đó sang phòng mới của bác sĩ.
+    Đổi phòng nên được chặn trước bằng room_move_conflicts. Nếu phòng mới vẫn đã bị chiếm (dữ liệu cũ), lịch đó
+    chỉ giữ ô của bác sĩ (room trống) để vẫn chặn trùng giờ của bác sĩ; scan_double_bookings báo room_overlap.
+    """
+    appts = list(
+        Appointment.objects.filter(doctor=doctor, end_at__gt=timezone.now(), start_at__isnull=False)
+        .exclude(status=Appointment.Status.CANCELLED)
+    )
+    cells = []
+    for appt in appts:
+        if move_room:
+            appt.room_id = doctor.room_id
+        cells += build_cells(appt, doctor.booking_buffer_minutes)
+    with transaction.atomic():
+        if move_room:
+            Appointment.objects.filter(pk__in=[a.pk for a in appts]).update(room_id=doctor.room_id)
+        AppointmentCell.objects.filter(appointment__in=appts).delete()
+        try:
+            with transaction.atomic():
+                AppointmentCell.objects.bulk_create(cells, batch_size=1000)
+        except IntegrityError:
+            _rebuild_one_by_one(appts, doctor.booking_buffer_minutes)
+
+
+def _rebuild_one_by_one(appts, buffer_minutes):
+    for appt in appts:
+        cells = build_cells(appt, buffer_minutes)
+        try:
+            with transaction.atomic():
+                AppointmentCell.objects.bulk_create(cells)
+        except IntegrityError:
+            for cell in cells:
+                cell.room_id = None
+            AppointmentCell.objects.bulk_create(cells, ignore_conflicts=True)
+
+
+def room_move_conflicts(doctor, room_number):
+    """
+    True nếu chuyển bác sĩ sang phòng room_number làm lịch hẹn sắp tới của bác sĩ trùng phòng với lịch hẹn
+    (hoặc lượt giữ chỗ còn hạn) của bác sĩ khác. Gọi khi kiểm tra form/serializer trước khi lưu Doctor.
+    """
+    code = Room.normalize_code(room_number)
+    room = Room.objects.filter(code=code).first() if code else None
+    if room is None or doctor.pk is None or room.pk == doctor.room_id:
+        return False
+    now = timezone.now()
+    spans = (
+        Appointment.objects.filter(doctor=doctor, end_at__gt=now, start_at__isnull=False)
+        .exclude(status=Appointment.Status.CANCELLED)
+        .values_list("start_at", "end_at")
+    )
+    starts = [c for s, e in spans for c in cell_starts(s, e)]
+    if not starts:
+        return False
+    return (
+        AppointmentCell.objects.filter(room=room, cell_start__in=starts)
+        .exclude(doctor=doctor)
+        .exclude(hold__expires_at__lte=now)
+        .exists()
+    )
@@ -1,7 +1,14 @@
+import math
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import F
 from django.utils import timezone
 from rest_framework import serializers
-from .models import Appointment, AppointmentImage
+from rest_framework.exceptions import APIException
+from .models import Appointment, AppointmentImage, SlotHold
 from doctors.models import Doctor
+from doctors.scheduling import _mins, _without_held, clinic_closures, day_grid, free_slots_many, held_intervals
 
 class AppointmentImageSerializer(serializers.ModelSerializer):
     class Meta:
@@ -47,60 +54,117 @@ class AppointmentSerializer(serializers.ModelSerializer):
     def get_has_review(self, obj):
         return hasattr(obj, "review")
 
-def _ensure_within_availability_and_grid(doctor, start_at, end_at):
+def _local_minutes(start_at, end_at):
     tz = timezone.get_current_timezone()
 
     s = timezone.localtime(start_at, tz) if timezone.is_aware(start_at) else start_at
     e = timezone.localtime(end_at,   tz) if timezone.is_aware(end_at)   else end_at
 
+    def _secs(t): return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+    return s, e, math.floor(_secs(s.time()) / 60), math.ceil(_secs(e.time()) / 60)
+
+def _ensure_within_availability_and_grid(doctor, start_at, end_at):
+    s, e, s_m, e_m = _local_minutes(start_at, end_at)
+
     if s.date() != e.date():
         raise serializers.ValidationError("Lịch phải bắt đầu/kết thúc trong cùng một ngày.")
 
-    weekday = s.weekday()
-    avails = doctor.availabilities.filter(weekday=weekday, is_active=True)
-    if not avails.exists():
-        raise serializers.ValidationError("Ngày này bác sĩ không làm việc.")
+    for closure in clinic_closures(s.date(), s.date()).get(s.date(), ()):
+        full_day = closure.start_time is None and closure.end_time is None
+        if full_day or (closure.start_time and closure.end_time
+                        and _mins(closure.start_time) < e_m and s_m < _mins(closure.end_time)):
+            reason = f" ({closure.reason})" if closure.reason else ""
+            raise serializers.ValidationError(f"Phòng khám nghỉ trong thời gian này{reason}.")
 
-    s_time = s.time()
-    e_time = e.time()
+    grid = day_grid(doctor, s.date())
+    if not grid.windows:
+        raise serializers.ValidationError("Ngày này bác sĩ không làm việc.")
 
-    match = None
-    for av in avails:
-        if av.start_time <= s_time and av.end_time >= e_time:
-            match = av
-            break
+    match = grid.window_for(s_m, e_m)
     if not match:
         raise serializers.ValidationError("Khung giờ nằm ngoài giờ làm việc của bác sĩ.")
 
-    slot = match.slot_minutes
+    w_start, _, slot = match
 
     dur_min = int((e - s).total_seconds() // 60)
     if dur_min <= 0 or dur_min % slot != 0:
         raise serializers.ValidationError(f"Độ dài lịch phải là bội số của {slot} phút.")
 
-    def _mins(t): return t.hour * 60 + t.minute
-    offset = _mins(s_time) - _mins(match.start_time)
-    if offset % slot != 0:
-        raise serializers.ValidationError(f"Giờ bắt đầu phải khớp lưới {slot} phút từ {match.start_time}.")
-    
-    offs = doctor.day_offs.filter(date=s.date())
-    if offs.filter(start_time__isnull=True, end_time__isnull=True).exists():
+    if (s_m - w_start) % slot != 0:
+        raise serializers.ValidationError(f"Giờ bắt đầu phải khớp lưới {slot} phút từ {w_start // 60:02d}:{w_start % 60:02d}:00.")
+
+    if grid.full_day_off:
         raise serializers.ValidationError("Bác sĩ nghỉ cả ngày.")
 
-    def _mins(t): return t.hour * 60 + t.minute
-    s_m = _mins(s.time()); e_m = _mins(e.time())
-    for off in offs:
-        if off.start_time and off.end_time:
-            o_s = _mins(off.start_time); o_e = _mins(off.end_time)
-            if s_m < o_e and e_m > o_s:
-                raise serializers.ValidationError("Khung giờ trùng với thời gian bác sĩ nghỉ.")
+    if grid.off & grid.mask(s_m, e_m):
+        raise serializers.ValidationError("Khung giờ trùng với thời gian bác sĩ nghỉ.")
+
+    return grid
+
+class SlotTaken(APIException):
+    """400 khi khung giờ bị trùng. Không dùng ValidationError để các slot gợi ý giữ nguyên kiểu dữ liệu."""
+    status_code = 400
+    default_code = "slot_taken"
+
+    def __init__(self, data):
+        self.detail = data
+
+def _nearest(slots, start, k, exclude=None):
+    """k slot (start, end) có giờ bắt đầu gần `start` nhất, bỏ slot trong quá khứ và slot giao với `exclude`."""
+    now = timezone.now()
+    candidates = [
+        (s, e) for s, e in slots
+        if s >= now and not (exclude and s < exclude[1] and exclude[0] < e)
+    ]
+    candidates.sort(key=lambda x: (abs((x[0] - start).total_seconds()), x[0]))
+    return [{"start_at": s.isoformat(), "end_at": e.isoformat()} for s, e in candidates[:k]]
+
+def booking_alternatives(doctor, grid, start, end, other_doctors=False):
+    """
+    Gợi ý khi khung giờ bị trùng: các slot trống gần nhất trong ngày, lấy từ DayGrid đã nạp lúc kiểm tra
+    (chỉ thêm một truy vấn lượt giữ chỗ), và nếu other_doctors=True thì thêm slot cùng ngày của bác sĩ
+    cùng chuyên khoa. Slot đang được người khác giữ chỗ không được gợi ý.
+    """
+    k = getattr(settings, "BOOKING_ALTERNATIVES", 3)
+    day_start = timezone.make_aware(datetime.combine(grid.date, time.min))
+    own = [(day_start + timedelta(minutes=s), day_start + timedelta(minutes=e)) for s, e in grid.slots()]
+    own = _without_held(own, held_intervals([doctor], grid.date, grid.date).get(doctor.pk))
+    out = {"alternatives": _nearest(own, start, k, exclude=(start, end))}
+
+    if other_doctors and doctor.specialty_id:
+        limit = getattr(settings, "BOOKING_ALTERNATIVE_DOCTORS", 5)
+        others = list(
+            Doctor.objects.select_related("user")
+            .filter(specialty_id=doctor.specialty_id, is_active=True, user__is_active=True)
+            .exclude(pk=doctor.pk)
+            .order_by(F("next_available_at").asc(nulls_last=True), "id")[:limit]
+        )
+        by_doctor = free_slots_many(others, grid.date, grid.date, hide_held=True) if others else {}
+        out["other_doctors"] = []
+        for other in others:
+            slots = _nearest(by_doctor[other.pk][0][1], start, k)
+            if slots:
+                out["other_doctors"].append({
+                    "doctor_id": other.id,
+                    "doctor_slug": other.slug,
+                    "doctor_name": other.user.full_name,
+                    "slots": slots,
+                })
+    return out
 
 class AppointmentCreateSerializer(serializers.ModelSerializer):
     doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all())
+    suggest_other_doctors = serializers.BooleanField(write_only=True, required=False, default=False)
 
     class Meta:
         model  = Appointment
-        fields = ["doctor", "start_at", "end_at", "note"]
+        fields = ["doctor", "start_at", "end_at", "note", "suggest_other_doctors"]
+
+    def clash_error(self, message, start, end):
+        """Lỗi trùng giờ kèm slot gợi ý, dùng DayGrid đã nạp trong validate()."""
+        data = {"non_field_errors": [message]}
+        data.update(booking_alternatives(self.doctor, self.grid, start, end, self.suggest_other_doctors))
+        return SlotTaken(data)
 
     def validate(self, data):
         start = data["start_at"]
@@ -116,10 +180,19 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
         if not doctor.user.is_active:
             raise serializers.ValidationError("Tài khoản bác sĩ đang bị khóa.")
 
-        _ensure_within_availability_and_grid(doctor, start, end)
+        self.doctor = doctor
+        self.suggest_other_doctors = data.pop("suggest_other_doctors", False)
+        self.grid = _ensure_within_availability_and_grid(doctor, start, end)
 
-        qs = doctor.appointments.exclude(status=Appointment.Status.CANCELLED)
-        if qs.filter(start_at__lt=end, end_at__gt=start).exists():
-            raise serializers.ValidationError("Khung giờ đã có người đặt. Vui lòng chọn giờ khác.")
+        _, _, s_m, e_m = _local_minutes(start, end)
+        if self.grid.busy & self.grid.mask(s_m, e_m):
+            raise self.clash_error("Khung giờ đã có người đặt. Vui lòng chọn giờ khác.", start, end)
 
         return data
+
+class SlotHoldSerializer(AppointmentCreateSerializer):
+    """Giữ chỗ dùng đúng các kiểm tra của đặt lịch."""
+
+    class Meta:
+        model  = SlotHold
+        fields = ["doctor", "start_at", "end_at", "suggest_other_doctors"]
@@ -1,3 +1,224 @@
+import io
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from doctors.models import Doctor, DoctorAvailability
+from doctors.serializers import DoctorSerializer
+from patients.models import Patient
+from .models import Appointment, AppointmentCell, SlotHold
+from .occupancy import CellConflict, hold_slot, room_move_conflicts
+
+
+def make_doctor(name, room_number=None, buffer_minutes=None):
+    user = CustomUser.objects.create_user(
+        email=f"{name.replace(' ', '').lower()}@example.com", password="x", full_name=name, role="DOCTOR"
+    )
+    doctor = Doctor.objects.create(user=user, room_number=room_number, buffer_minutes=buffer_minutes)
+    for weekday in range(7):
+        DoctorAvailability.objects.create(
+            doctor=doctor, weekday=weekday, start_time=time(8), end_time=time(17), slot_minutes=30
+        )
+    doctor.refresh_from_db()
+    return doctor
+
+
+def make_patient(name):
+    user = CustomUser.objects.create_user(
+        email=f"{name.replace(' ', '').lower()}@example.com", password="x", full_name=name, role="PATIENT"
+    )
+    return Patient.objects.create(user=user)
+
+
+class OccupancyTestBase(TestCase):
+    def setUp(self):
+        # Cache slot/grid khóa theo pk bác sĩ, pk được dùng lại giữa các test
+        cache.clear()
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.doctor = make_doctor("Bac Si An", room_number="A1")
+        self.patient = make_patient("Benh Nhan Mot")
+        self.other_patient = make_patient("Benh Nhan Hai")
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def book(self, doctor=None, patient=None, start=None, end=None, **extra):
+        return Appointment.objects.create(
+            doctor=doctor or self.doctor, patient=patient or self.patient,
+            room_id=(doctor or self.doctor).room_id, start_at=start, end_at=end, **extra
+        )
+
+    def cells(self, appointment):
+        return AppointmentCell.objects.filter(appointment=appointment).order_by("cell_start")
+
+    def client_for(self, patient):
+        client = APIClient()
+        client.force_authenticate(patient.user)
+        return client
+
+    def post_booking(self, patient, start, end):
+        return self.client_for(patient).post(
+            "/api/appointments/",
+            {"doctor": self.doctor.pk, "start_at": start.isoformat(), "end_at": end.isoformat()},
+            format="json",
+        )
+
+
+class AppointmentCellTests(OccupancyTestBase):
+    def test_create_writes_core_cells_with_room(self):
+        response = self.post_booking(self.patient, self.at(9), self.at(9, 30))
+        self.assertEqual(response.status_code, 201)
+        appt = Appointment.objects.get(pk=response.data["id"])
+        cells = self.cells(appt)
+        self.assertEqual(cells.count(), 6)
+        self.assertEqual({c.room_id for c in cells}, {self.doctor.room_id})
+        self.assertEqual(cells.first().cell_start, self.at(9))
+
+    def test_clashing_booking_is_rejected(self):
+        self.assertEqual(self.post_booking(self.patient, self.at(9), self.at(9, 30)).status_code, 201)
+        response = self.post_booking(self.other_patient, self.at(9), self.at(9, 30))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 1)
+
+    def test_conflict_rolls_back_appointment_row(self):
+        self.book(start=self.at(9), end=self.at(9, 30))
+        with self.assertRaises(CellConflict):
+            self.book(patient=self.other_patient, start=self.at(9, 15), end=self.at(9, 45))
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 1)
+        self.assertEqual(AppointmentCell.objects.filter(doctor=self.doctor).count(), 6)
+
+    def test_cancel_frees_cells(self):
+        appt = self.book(start=self.at(9), end=self.at(9, 30))
+        response = self.client_for(self.patient).post(f"/api/appointments/{appt.pk}/cancel/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.cells(appt).exists())
+        self.assertEqual(self.post_booking(self.other_patient, self.at(9), self.at(9, 30)).status_code, 201)
+
+    def test_cancelled_status_save_frees_cells(self):
+        appt = self.book(start=self.at(9), end=self.at(9, 30))
+        appt.status = Appointment.Status.CANCELLED
+        appt.save()
+        self.assertFalse(self.cells(appt).exists())
+        self.book(patient=self.other_patient, start=self.at(9), end=self.at(9, 30))
+
+    def test_reschedule_moves_cells(self):
+        appt = self.book(start=self.at(9), end=self.at(9, 30))
+        response = self.client_for(self.patient).post(
+            f"/api/appointments/{appt.pk}/reschedule/",
+            {"start_at": self.at(10).isoformat(), "end_at": self.at(10, 30).isoformat()},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        cells = self.cells(appt)
+        self.assertEqual(cells.count(), 6)
+        self.assertEqual(cells.first().cell_start, self.at(10))
+        self.book(patient=self.other_patient, start=self.at(9), end=self.at(9, 30))
+
+    def test_reschedule_into_taken_slot_keeps_old_cells(self):
+        appt = self.book(start=self.at(9), end=self.at(9, 30))
+        self.book(patient=self.other_patient, start=self.at(10), end=self.at(10, 30))
+        response = self.client_for(self.patient).post(
+            f"/api/appointments/{appt.pk}/reschedule/",
+            {"start_at": self.at(10).isoformat(), "end_at": self.at(10, 30).isoformat()},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        appt.refresh_from_db()
+        self.assertEqual(appt.start_at, self.at(9))
+        self.assertEqual(self.cells(appt).first().cell_start, self.at(9))
+
+    def test_buffer_cells_have_no_room(self):
+        self.doctor.buffer_minutes = 10
+        self.doctor.save()
+        appt = self.book(start=self.at(9), end=self.at(9, 30))
+        cells = list(self.cells(appt))
+        self.assertEqual(len(cells), 8)
+        self.assertEqual([c.room_id for c in cells[6:]], [None, None])
+        with self.assertRaises(CellConflict):
+            self.book(patient=self.other_patient, start=self.at(9, 30), end=self.at(10))
+        # Bác sĩ khác dùng cùng phòng ngay sau lịch: ô buffer không chặn phòng
+        colleague = make_doctor("Bac Si Binh", room_number="A1")
+        self.book(doctor=colleague, patient=self.other_patient, start=self.at(9, 30), end=self.at(10))
+
+
+class SlotHoldTests(OccupancyTestBase):
+    def test_own_hold_is_claimed_when_booking(self):
+        hold_slot(self.doctor, self.patient, self.at(9), self.at(9, 30))
+        self.assertEqual(self.post_booking(self.other_patient, self.at(9), self.at(9, 30)).status_code, 400)
+
+        response = self.post_booking(self.patient, self.at(9), self.at(9, 30))
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(SlotHold.objects.filter(patient=self.patient).exists())
+        self.assertFalse(AppointmentCell.objects.filter(hold__isnull=False).exists())
+
+    def test_expired_hold_is_purged_and_booking_retried(self):
+        hold = hold_slot(self.doctor, self.patient, self.at(9), self.at(9, 30))
+        SlotHold.objects.filter(pk=hold.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        appt = self.book(patient=self.other_patient, start=self.at(9), end=self.at(9, 30))
+        self.assertEqual(self.cells(appt).count(), 6)
+        self.assertFalse(SlotHold.objects.filter(pk=hold.pk).exists())
+
+    def test_live_hold_blocks_other_patient(self):
+        hold_slot(self.doctor, self.patient, self.at(9), self.at(9, 30))
+        with self.assertRaises(CellConflict):
+            self.book(patient=self.other_patient, start=self.at(9), end=self.at(9, 30))
+
+
+class DoctorChangeTests(OccupancyTestBase):
+    def test_buffer_change_rewrites_cells(self):
+        appt = self.book(start=self.at(9), end=self.at(9, 30))
+        self.doctor.buffer_minutes = 15
+        self.doctor.save()
+        self.assertEqual(self.cells(appt).count(), 9)
+
+        self.doctor.buffer_minutes = 0
+        self.doctor.save()
+        self.assertEqual(self.cells(appt).count(), 6)
+
+    def test_room_change_moves_appointments_and_cells(self):
+        appt = self.book(start=self.at(9), end=self.at(9, 30))
+        self.doctor.room_number = "B2"
+        self.doctor.save()
+        appt.refresh_from_db()
+        self.assertEqual(appt.room_id, self.doctor.room_id)
+        self.assertEqual({c.room_id for c in self.cells(appt)}, {self.doctor.room_id})
+
+    def test_room_move_into_busy_room_is_rejected(self):
+        other = make_doctor("Bac Si Chau", room_number="C3")
+        self.book(start=self.at(9), end=self.at(9, 30))
+        self.book(doctor=other, patient=self.other_patient, start=self.at(9, 15), end=self.at(9, 45))
+
+        self.assertTrue(room_move_conflicts(other, "a1"))
+        self.assertFalse(room_move_conflicts(other, "D4"))
+        serializer = DoctorSerializer(other, data={"room_number": "A1"}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("room_number", serializer.errors)
+
+    def test_forced_room_move_keeps_doctor_cells(self):
+        other = make_doctor("Bac Si Dung", room_number="C3")
+        self.book(start=self.at(9), end=self.at(9, 30))
+        clash = self.book(doctor=other, patient=self.other_patient, start=self.at(9, 15), end=self.at(9, 45))
+        free = self.book(doctor=other, patient=self.other_patient, start=self.at(11), end=self.at(11, 30))
+
+        other.room_number = "A1"
+        other.save()
+        self.assertEqual({c.room_id for c in self.cells(clash)}, {None})
+        self.assertEqual(self.cells(clash).count(), 6)
+        self.assertEqual({c.room_id for c in self.cells(free)}, {self.doctor.room_id})
+        with self.assertRaises(CellConflict):
+            self.book(doctor=other, start=self.at(9, 15), end=self.at(9, 45))
 
-# Create your tests here.
+        out = io.StringIO()
+        call_command("scan_double_bookings", "--since", str(self.day), "--until", str(self.day), stdout=out)
+        issues = json.loads(out.getvalue())["issues"]
+        self.assertEqual(
+            [(i["appointment_id"], i["other_doctor_id"]) for i in issues if i["type"] == "room_overlap"],
+            [(clash.pk, self.doctor.pk)],
+        )
@@ -9,8 +9,10 @@ router.register(r'doctors', admin_api_views.AdminDoctorViewSet, basename='admin-
 router.register(r'appointments', admin_api_views.AdminAppointmentViewSet, basename='admin-appointments')
 router.register(r'specialties', admin_api_views.AdminSpecialtyViewSet, basename='admin-specialties')
 router.register(r'reviews', admin_api_views.AdminReviewViewSet, basename='admin-reviews')
+router.register(r'closures', admin_api_views.AdminClinicClosureViewSet, basename='admin-closures')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('statistics/', admin_api_views.AdminStatisticsView.as_view(), name='admin-statistics'),
+    path('slot-cache/', admin_api_views.AdminSlotCacheStatsView.as_view(), name='admin-slot-cache'),
 ]
\ No newline at end of file
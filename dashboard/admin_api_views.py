@@ -9,10 +9,11 @@ from django.db.models import Count, Q
 from django.utils import timezone
 
 from accounts.models import CustomUser
-from doctors.models import Doctor, Specialty, DoctorReview
+from doctors.models import Doctor, Specialty, DoctorReview, ClinicClosure
+from doctors.scheduling import slot_cache_stats
 from patients.models import Patient
 from appointments.models import Appointment
-from .admin_serializers import AdminUserSerializer, AdminDoctorSerializer, AdminAppointmentSerializer, AdminSpecialtySerializer, AdminReviewSerializer
+from .admin_serializers import AdminUserSerializer, AdminDoctorSerializer, AdminAppointmentSerializer, AdminSpecialtySerializer, AdminReviewSerializer, AdminClinicClosureSerializer
 
 class AdminUserPagination(PageNumberPagination):
     page_size = 20
@@ -177,6 +178,19 @@ class AdminSpecialtyViewSet(viewsets.ModelViewSet):
             "is_active": specialty.is_active
         })
 
+class AdminClinicClosureViewSet(viewsets.ModelViewSet):
+    """Ngày nghỉ chung của phòng khám: một dòng áp dụng cho mọi bác sĩ thay vì một DoctorDayOff mỗi người."""
+    serializer_class = AdminClinicClosureSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    queryset = ClinicClosure.objects.all()
+
+    def get_queryset(self):
+        queryset = ClinicClosure.objects.all()
+        upcoming = self.request.query_params.get('upcoming')
+        if upcoming and upcoming.lower() == 'true':
+            queryset = queryset.filter(date__gte=timezone.localdate())
+        return queryset
+
 class AdminReviewViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = AdminReviewSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
@@ -212,4 +226,10 @@ class AdminStatisticsView(APIView):
             'pending_appointments': Appointment.objects.filter(status='PENDING').count(),
             'completed_appointments': Appointment.objects.filter(status='COMPLETED').count(),
         }
-        return Response(stats)
\ No newline at end of file
+        return Response(stats)
+
+class AdminSlotCacheStatsView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(slot_cache_stats())
\ No newline at end of file
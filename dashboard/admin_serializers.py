@@ -1,9 +1,10 @@
 # dashboard/admin_serializers.py
 from rest_framework import serializers
 from accounts.models import CustomUser
-from doctors.models import Doctor, Specialty, DoctorReview
+from doctors.models import Doctor, Specialty, DoctorReview, ClinicClosure
 from patients.models import Patient
 from appointments.models import Appointment
+from appointments.occupancy import room_move_conflicts
 
 class AdminUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,7 +24,12 @@ class AdminDoctorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Doctor
         fields = ['id', 'user', 'specialty_name', 'bio', 'experience_detail', 'experience_years', 
-                 'average_rating', 'is_active', 'is_featured', 'started_practice', 'room_number', 'profile_picture']
+                 'average_rating', 'is_active', 'is_featured', 'started_practice', 'room_number', 'buffer_minutes', 'profile_picture']
+
+    def validate_room_number(self, value):
+        if self.instance is not None and room_move_conflicts(self.instance, value):
+            raise serializers.ValidationError("Phòng này đang có lịch hẹn trùng giờ với lịch sắp tới của bác sĩ.")
+        return value
 
 class AdminAppointmentSerializer(serializers.ModelSerializer):
     doctor_name = serializers.CharField(source='doctor.user.full_name', read_only=True)
@@ -42,6 +48,20 @@ class AdminSpecialtySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'is_active', 'specialty_picture', 'slug']
         read_only_fields = ['slug']
 
+class AdminClinicClosureSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ClinicClosure
+        fields = ['id', 'date', 'start_time', 'end_time', 'reason']
+
+    def validate(self, data):
+        start = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end = data.get('end_time', getattr(self.instance, 'end_time', None))
+        if (start is None) != (end is None):
+            raise serializers.ValidationError("Cần nhập cả giờ bắt đầu và giờ kết thúc, hoặc bỏ trống cả hai để nghỉ cả ngày.")
+        if start is not None and start >= end:
+            raise serializers.ValidationError("Giờ kết thúc phải sau giờ bắt đầu.")
+        return data
+
 class AdminReviewSerializer(serializers.ModelSerializer):
     doctor_name = serializers.CharField(source='doctor.user.full_name', read_only=True)
     patient_name = serializers.CharField(source='patient.user.full_name', read_only=True)
@@ -1,9 +1,24 @@
+from django import forms
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Doctor
+from appointments.occupancy import room_move_conflicts
+from .models import ClinicClosure, Doctor, Room
+
+class DoctorAdminForm(forms.ModelForm):
+    class Meta:
+        model = Doctor
+        fields = "__all__"
+
+    def clean_room_number(self):
+        # Ô của lịch hẹn được dựng lại theo phòng mới khi lưu (doctors.signals); chặn trước nếu phòng mới đã bị chiếm
+        value = self.cleaned_data.get("room_number")
+        if room_move_conflicts(self.instance, value):
+            raise forms.ValidationError("Phòng này đang có lịch hẹn trùng giờ với lịch sắp tới của bác sĩ.")
+        return value
 
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
+    form = DoctorAdminForm
     list_display = ("id", "name", "specialty", "preview", "is_active")
     readonly_fields = ("preview",)
 
@@ -16,3 +31,16 @@ class DoctorAdmin(admin.ModelAdmin):
             return format_html('<img src="{}" width="120" style="border-radius: 6px;" />', obj.profile_picture.url)
         return "No Image"
     preview.short_description = "Profile Picture"
+
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ("id", "code", "name", "is_active")
+    search_fields = ("code", "name")
+
+
+@admin.register(ClinicClosure)
+class ClinicClosureAdmin(admin.ModelAdmin):
+    list_display = ("id", "date", "start_time", "end_time", "reason")
+    date_hierarchy = "date"
+    search_fields = ("reason",)
@@ -1,10 +1,11 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .api_views import DoctorViewSet, DoctorAvailabilityViewSet, DoctorDayOffViewSet, DoctorReviewCreateView
+from .api_views import DoctorViewSet, DoctorAvailabilityViewSet, DoctorDayOffViewSet, DoctorReviewCreateView, RoomViewSet
 
 router = DefaultRouter()
 router.register(r'availability', DoctorAvailabilityViewSet, basename='doctor-availability')
 router.register(r'days-off', DoctorDayOffViewSet, basename='doctor-dayoff')
+router.register(r'rooms', RoomViewSet, basename='room')
 router.register(r'', DoctorViewSet, basename='doctor')
 
 urlpatterns = router.urls + [
@@ -1,21 +1,202 @@
+import base64
+import json
+import zlib
+
 from rest_framework import viewsets
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, SAFE_METHODS
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.exceptions import PermissionDenied, ValidationError, ParseError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import filters
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 from django.db.models import Avg
-from datetime import datetime, timedelta, date as date_cls, time
+from datetime import datetime, time, timedelta, date as date_cls
 from django.db.models import F, ExpressionWrapper, IntegerField
 
-from .models import Doctor, DoctorAvailability, DoctorDayOff, Specialty, DoctorReview
-from .serializers import DoctorSerializer, DoctorAvailabilitySerializer, DoctorDayOffSerializer, SpecialtySerializer, DoctorReviewSerializer
-from appointments.models import Appointment
+from .models import Doctor, DoctorAvailability, DoctorDayOff, Specialty, DoctorReview, Room, ClinicClosure
+from .serializers import DoctorSerializer, DoctorAvailabilitySerializer, DoctorWeekSerializer, DoctorDayOffSerializer, SpecialtySerializer, DoctorReviewSerializer, RoomSerializer
+from .scheduling import (
+    free_slots, free_slots_many, free_runs, free_slot_counts, earliest_free_slots, room_utilization, doctor_agenda,
+    schedule_changed, batched_schedule_changes,
+)
+from appointments.models import Appointment, SlotHold
+
+def _parse_date_range(params, max_days=None):
+    """Đọc ?date=YYYY-MM-DD hoặc ?start=&end= và trả về (start_date, end_date)."""
+    date_str = params.get("date")
+    start_str = params.get("start")
+    end_str = params.get("end")
+
+    if date_str:
+        try:
+            target_date = date_cls.fromisoformat(date_str)
+        except ValueError:
+            raise ParseError("Invalid date format")
+        return target_date, target_date
+
+    if not (start_str and end_str):
+        raise ParseError("Missing query param: date=YYYY-MM-DD hoặc start/end")
+
+    try:
+        start_date = date_cls.fromisoformat(start_str)
+        end_date = date_cls.fromisoformat(end_str)
+    except ValueError:
+        raise ParseError("Invalid date format")
+
+    if end_date < start_date:
+        raise ParseError("end must be >= start")
+
+    max_days = max_days or getattr(settings, "SLOTS_MAX_RANGE_DAYS", 92)
+    if (end_date - start_date).days + 1 > max_days:
+        raise ParseError(f"Khoảng ngày tối đa là {max_days} ngày.")
+
+    return start_date, end_date
+
+def _parse_duration(params):
+    """?duration=<phút> (tùy chọn) cho slots: chỉ trả về giờ bắt đầu đủ chỗ cho cả lịch hẹn."""
+    value = params.get("duration")
+    if not value:
+        return None
+    if not value.isdigit() or not 0 < int(value) <= 24 * 60:
+        raise ParseError("duration phải là số phút từ 1 đến 1440.")
+    return int(value)
+
+def _parse_month(params):
+    """Đọc ?month=YYYY-MM (hoặc start/end) và trả về (start_date, end_date)."""
+    month_str = params.get("month")
+    if not month_str:
+        return _parse_date_range(params, max_days=62)
+    try:
+        start_date = date_cls.fromisoformat(f"{month_str}-01")
+    except ValueError:
+        raise ParseError("Invalid month format, expected YYYY-MM")
+    next_month = (start_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start_date, next_month - timedelta(days=1)
+
+def _slot_day(target_date, day_slots):
+    return {
+        "date": str(target_date),
+        "slots": [{"start_at": s.isoformat(), "end_at": e.isoformat()} for s, e in day_slots],
+    }
+
+def _compact_day(target_date, day_slots):
+    """
+    Dạng gọn của _slot_day (?format=compact): các slot cùng độ dài và cùng lưới được gom thành
+    {origin, slot_minutes, mask}, bit i của mask (base64, bit cao trước) = slot origin + i * slot_minutes còn trống.
+    """
+    grids = []
+    for s, e in day_slots:
+        minutes = int((e - s).total_seconds() // 60)
+        if grids:
+            grid = grids[-1]
+            offset = int((s - grid["origin"]).total_seconds() // 60)
+        if not grids or minutes != grid["slot_minutes"] or offset % minutes:
+            grid = {"origin": s, "slot_minutes": minutes, "cells": []}
+            grids.append(grid)
+            offset = 0
+        grid["cells"].append(offset // minutes)
+
+    out = []
+    for grid in grids:
+        bits = bytearray(grid["cells"][-1] // 8 + 1)
+        for i in grid["cells"]:
+            bits[i >> 3] |= 0x80 >> (i & 7)
+        out.append({
+            "origin": grid["origin"].isoformat(),
+            "slot_minutes": grid["slot_minutes"],
+            "mask": base64.b64encode(bytes(bits)).decode("ascii"),
+        })
+    return {"date": str(target_date), "grids": out}
+
+def _day_slots(doctor, start_date, end_date, now, tz, duration=None):
+    if duration:
+        return free_runs(doctor, start_date, end_date, duration, now, tz, hide_held=True)
+    return free_slots(doctor, start_date, end_date, now, tz, hide_held=True, count_stats=True)
+
+def _stream_slot_days(doctor, start_date, end_date, now, tz, chunk_days=7, day_format=_slot_day, duration=None):
+    # Mỗi lần chỉ nạp một tuần nên bộ nhớ không phụ thuộc độ dài khoảng ngày
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+        for target_date, day_slots in _day_slots(doctor, chunk_start, chunk_end, now, tz, duration):
+            yield json.dumps(day_format(target_date, day_slots), ensure_ascii=False) + "\n"
+        chunk_start = chunk_end + timedelta(days=1)
+
+def _agenda_day(target_date, entries):
+    items = []
+    for s, e, kind, obj in entries:
+        item = {"type": kind, "start_at": s.isoformat(), "end_at": e.isoformat()}
+        if kind == "appointment":
+            item.update({
+                "id": obj.id,
+                "status": obj.status,
+                "patient_id": obj.patient_id,
+                "patient_name": obj.patient.user.full_name if obj.patient else None,
+                "note": obj.note,
+            })
+        elif kind == "blocked":
+            item.update({
+                "id": obj.id,
+                "reason": obj.reason,
+                "all_day": obj.start_time is None,
+                "scope": "clinic" if isinstance(obj, ClinicClosure) else "doctor",
+            })
+        items.append(item)
+    return {"date": str(target_date), "items": items}
+
+def _agenda_date(params):
+    date_str = params.get("date")
+    if not date_str:
+        return timezone.localdate()
+    try:
+        return date_cls.fromisoformat(date_str)
+    except ValueError:
+        raise ParseError("Invalid date format")
+
+def _doctor_stamp(slug, field):
+    """(pk, giá trị version) của bác sĩ, một truy vấn nhẹ để tính ETag trước khi làm việc khác."""
+    return Doctor.objects.filter(slug=slug, is_active=True).values_list("pk", field).first()
+
+def _hold_stamp(doctor_id, start_date, end_date, now, tz):
+    """
+    Dấu của các lượt giữ chỗ còn hạn trong khoảng ngày (cho ETag của slots). Lượt giữ tạo mới, bị nhả
+    hay hết hạn đều làm dấu đổi, nên không cần tăng schedule_version cho từng lượt giữ.
+    """
+    rows = SlotHold.objects.filter(
+        doctor_id=doctor_id, expires_at__gt=now,
+        start_at__lt=timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz),
+        end_at__gt=timezone.make_aware(datetime.combine(start_date, time.min), tz),
+    ).order_by("pk").values_list("pk", flat=True)
+    ids = ",".join(str(pk) for pk in rows)
+    return f"{zlib.crc32(ids.encode()):08x}" if ids else "0"
+
+def _not_modified(request, etag):
+    """Response 304 nếu If-None-Match của client khớp etag (so sánh yếu), ngược lại None."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return None
+    tags = [t.removeprefix("W/") for t in parse_etags(header)]
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response["ETag"] = etag
+        return response
+    return None
+
+def _set_etag(response, etag):
+    response["ETag"] = etag
+    # Buộc trình duyệt gửi If-None-Match mỗi lần thay vì dùng bản cache cũ
+    patch_cache_control(response, no_cache=True)
+    return response
 
 class DoctorPagination(PageNumberPagination):
     page_size = 10
@@ -30,9 +211,17 @@ class DoctorViewSet(viewsets.ModelViewSet):
     search_fields = ["user__full_name"]
     
     def get_permissions(self):
+        if self.action in ("agenda", "agenda_week"):
+            return [IsAuthenticated()]
         if self.request.method in SAFE_METHODS:
             return [IsAuthenticatedOrReadOnly()]
         return [IsAuthenticated()]
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format=compact là dạng payload của slot, không phải tên renderer của DRF
+        if request.query_params.get("format") == "compact":
+            force = True
+        return super().perform_content_negotiation(request, force)
     
     def get_queryset(self):
         qs = Doctor.objects.select_related("user", "specialty").filter(is_active=True)
@@ -75,6 +264,10 @@ class DoctorViewSet(viewsets.ModelViewSet):
             if min_rating:
                 qs = qs.filter(average_rating_db__gte=float(min_rating))
 
+            # Bác sĩ chưa có slot trống (next_available_at = NULL) xếp cuối
+            if self.request.query_params.get("ordering") == "next_available":
+                qs = qs.order_by(F("next_available_at").asc(nulls_last=True), "id")
+
         return qs
 
     def perform_create(self, serializer):
@@ -97,97 +290,194 @@ class DoctorViewSet(viewsets.ModelViewSet):
         serializer.save(user=request.user) 
         return Response(serializer.data)
 
+    def retrieve(self, request, *args, **kwargs):
+        stamp = _doctor_stamp(kwargs[self.lookup_field], "profile_version")
+        if stamp is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        # experience_years phụ thuộc ngày hiện tại nên ETag đổi theo ngày
+        etag = f'W/"doctor-{stamp[0]}-p{stamp[1]}-{timezone.localdate():%Y%m%d}"'
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return _set_etag(super().retrieve(request, *args, **kwargs), etag)
+
+    @action(detail=False, methods=['get'], url_path='me/agenda')
+    def agenda(self, request):
+        """Lịch trong ngày của bác sĩ: lịch hẹn, slot trống và giờ nghỉ theo thứ tự thời gian."""
+        doctor = get_object_or_404(Doctor, user=request.user)
+        target_date = _agenda_date(request.query_params)
+        (_, entries), = doctor_agenda(doctor, target_date, target_date, timezone.now())
+        return Response(_agenda_day(target_date, entries))
+
+    @action(detail=False, methods=['get'], url_path='me/agenda/week')
+    def agenda_week(self, request):
+        """Như agenda nhưng cho cả tuần (thứ Hai đến Chủ Nhật) chứa ?date=."""
+        doctor = get_object_or_404(Doctor, user=request.user)
+        target_date = _agenda_date(request.query_params)
+        start_date = target_date - timedelta(days=target_date.weekday())
+        end_date = start_date + timedelta(days=6)
+        days = doctor_agenda(doctor, start_date, end_date, timezone.now())
+        return Response({
+            "start": str(start_date),
+            "end": str(end_date),
+            "days": [_agenda_day(d, entries) for d, entries in days],
+        })
+
     @action(detail=True, methods=['get'], url_path='slots')
     def slots(self, request, slug=None):
-        doctor = self.get_object()
         tz = timezone.get_current_timezone()
         now = timezone.now()
+        params = request.query_params
+
+        start_date, end_date = _parse_date_range(params)
+        compact = params.get("format") == "compact"
+        stream = params.get("stream") == "1"
+        duration = _parse_duration(params)
+        if duration and compact:
+            # Các khoảng dài duration chồng lên nhau nên không gom được thành mask theo lưới slot
+            raise ParseError("format=compact không dùng được cùng duration.")
+
+        # ETag tính từ schedule_version và các lượt giữ chỗ còn hạn trước khi dựng slot. Slot kết thúc đúng
+        # phút nên khi khoảng ngày chứa hôm nay, nội dung chỉ đổi khi qua phút mới.
+        etag = None
+        stamp = _doctor_stamp(slug, "schedule_version")
+        if stamp is not None:
+            local_now = timezone.localtime(now, tz)
+            bucket = f"{local_now:%Y%m%d%H%M}" if start_date <= local_now.date() <= end_date else "-"
+            etag = 'W/"slots-{}-v{}-h{}-{}-{}-{}{}{}-{}"'.format(
+                stamp[0], stamp[1], _hold_stamp(stamp[0], start_date, end_date, now, tz), start_date, end_date,
+                "c" if compact else "f", "s" if stream else "", f"d{duration}" if duration else "", bucket,
+            )
+            not_modified = _not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
 
-        date_str = request.query_params.get("date")
-        start_str = request.query_params.get("start")
-        end_str = request.query_params.get("end")
-
-        if date_str:
-            try:
-                target_date = date_cls.fromisoformat(date_str)
-            except ValueError:
-                return Response({"detail": "Invalid date format"}, status=400)
-            days = [target_date]
-
-        elif start_str and end_str:
-            try:
-                start_date = date_cls.fromisoformat(start_str)
-                end_date = date_cls.fromisoformat(end_str)
-            except ValueError:
-                return Response({"detail": "Invalid date format"}, status=400)
-
-            if end_date < start_date:
-                return Response({"detail": "end must be >= start"}, status=400)
+        doctor = self.get_object()
+        day_format = _compact_day if compact else _slot_day
 
-            days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        if stream:
+            response = StreamingHttpResponse(
+                _stream_slot_days(doctor, start_date, end_date, now, tz, day_format=day_format, duration=duration),
+                content_type="application/x-ndjson",
+            )
+            response["X-Accel-Buffering"] = "no"
         else:
-            return Response({"detail": "Missing query param: date=YYYY-MM-DD hoặc start/end"}, status=400)
-
-        results = []
-
-        for target_date in days:
-            weekday = target_date.weekday()
-            avails = doctor.availabilities.filter(weekday=weekday, is_active=True)
-
-            if not avails.exists():
-                results.append({"date": str(target_date), "slots": []})
-                continue
-
-            start_of_day = timezone.make_aware(datetime.combine(target_date, datetime.min.time()), tz)
-            end_of_day   = timezone.make_aware(datetime.combine(target_date, datetime.max.time()), tz)
-
-            taken = doctor.appointments.exclude(status="CANCELLED")\
-                .filter(start_at__lt=end_of_day, end_at__gt=start_of_day)\
-                .values_list("start_at", "end_at")
-            busy = [(s, e) for s, e in taken]
-
-            offs = doctor.day_offs.filter(date=target_date)
-            if offs.filter(start_time__isnull=True, end_time__isnull=True).exists():
-                results.append({"date": str(target_date), "slots": []})
-                continue
-
-            off_intervals = []
-            for off in offs:
-                if off.start_time and off.end_time:
-                    off_start = timezone.make_aware(datetime.combine(target_date, off.start_time), tz)
-                    off_end   = timezone.make_aware(datetime.combine(target_date, off.end_time), tz)
-                    off_intervals.append((off_start, off_end))
-
-            slots = []
-            for av in avails:
-                slot_len = timedelta(minutes=av.slot_minutes)
-                cur = timezone.make_aware(datetime.combine(target_date, av.start_time), tz)
-                limit = timezone.make_aware(datetime.combine(target_date, av.end_time), tz)
-
-                while cur + slot_len <= limit:
-                    slot_start = cur
-                    slot_end   = cur + slot_len
-
-                    if slot_end <= now:
-                        cur += slot_len
-                        continue
-
-                    overlap_busy = any((slot_start < b_end and slot_end > b_start) for b_start, b_end in busy)
-                    overlap_off  = any((slot_start < o_end and slot_end > o_start) for o_start, o_end in off_intervals)
-
-                    if not overlap_busy and not overlap_off:
-                        slots.append({
-                            "start_at": slot_start.isoformat(),
-                            "end_at":   slot_end.isoformat()
-                        })
+            results = []
+            for target_date, day_slots in _day_slots(doctor, start_date, end_date, now, tz, duration):
+                results.append(day_format(target_date, day_slots))
+            response = Response(results)
+
+        if etag is not None:
+            _set_etag(response, etag)
+        return response
+
+    @action(detail=False, methods=['get'], url_path='slots/batch')
+    def slots_batch(self, request):
+        target_date, _ = _parse_date_range(request.query_params, max_days=1)
+
+        slugs = [s.strip() for s in request.query_params.get("doctors", "").split(",") if s.strip()]
+        if not slugs:
+            return Response({"detail": "Missing query param: doctors=slug1,slug2,..."}, status=400)
+        max_doctors = DoctorPagination.max_page_size
+        if len(slugs) > max_doctors:
+            return Response({"detail": f"Tối đa {max_doctors} bác sĩ mỗi lần."}, status=400)
+
+        doctors = {d.slug: d for d in Doctor.objects.filter(is_active=True, slug__in=slugs)}
+        ordered = [doctors[slug] for slug in dict.fromkeys(slugs) if slug in doctors]
+        by_doctor = free_slots_many(
+            ordered, target_date, target_date, timezone.now(), hide_held=True, count_stats=True
+        )
+        compact = request.query_params.get("format") == "compact"
+
+        doctors_out = []
+        for doctor in ordered:
+            item = {"doctor_id": doctor.id, "doctor_slug": doctor.slug}
+            day_slots = by_doctor[doctor.pk][0][1]
+            if compact:
+                item["grids"] = _compact_day(target_date, day_slots)["grids"]
+            else:
+                item["slots"] = _slot_day(target_date, day_slots)["slots"]
+            doctors_out.append(item)
+
+        return Response({"date": str(target_date), "doctors": doctors_out})
+
+    @action(detail=True, methods=['get'], url_path='heatmap')
+    def heatmap(self, request, slug=None):
+        doctor = self.get_object()
+        start_date, end_date = _parse_month(request.query_params)
+        counts = free_slot_counts([doctor], start_date, end_date)[doctor.pk]
+        return Response({
+            "doctor_id": doctor.id,
+            "days": [{"date": str(d), "free_slots": n} for d, n in counts.items()],
+        })
+
+    @action(detail=False, methods=['get'], url_path='heatmap')
+    def specialty_heatmap(self, request):
+        specialty = request.query_params.get("specialty")
+        if not specialty:
+            return Response({"detail": "Missing query param: specialty"}, status=400)
+        start_date, end_date = _parse_month(request.query_params)
+
+        doctors = list(Doctor.objects.filter(is_active=True, specialty__slug__iexact=specialty))
+        by_doctor = free_slot_counts(doctors, start_date, end_date)
+
+        days = []
+        d = start_date
+        while d <= end_date:
+            per_doctor = [counts[d] for counts in by_doctor.values()]
+            days.append({
+                "date": str(d),
+                "free_slots": sum(per_doctor),
+                "doctors_available": sum(1 for n in per_doctor if n),
+            })
+            d += timedelta(days=1)
+
+        return Response({"specialty": specialty, "days": days})
+
+    @action(detail=False, methods=['get'], url_path='earliest')
+    def earliest(self, request):
+        specialty = request.query_params.get("specialty")
+        if not specialty:
+            return Response({"detail": "Missing query param: specialty"}, status=400)
 
-                    cur += slot_len
+        now = timezone.now()
+        after_str = request.query_params.get("after")
+        try:
+            after = parse_datetime(after_str) if after_str else now
+        except ValueError:
+            # Đúng định dạng nhưng ngoài miền giá trị, ví dụ tháng 13
+            after = None
+        if after is None:
+            return Response({"detail": "Invalid datetime format"}, status=400)
+        if timezone.is_naive(after):
+            after = timezone.make_aware(after, timezone.get_current_timezone())
+        after = max(after, now)
 
-            results.append({"date": str(target_date), "slots": slots})
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            return Response({"detail": "limit must be an integer"}, status=400)
+
+        doctors = (
+            Doctor.objects.select_related("user")
+            .filter(is_active=True, specialty__slug__iexact=specialty, availabilities__is_active=True)
+            .distinct()
+        )
 
+        results = [
+            {
+                "doctor_id": doctor.id,
+                "doctor_slug": doctor.slug,
+                "doctor_name": doctor.user.full_name,
+                "room_number": doctor.room_number,
+                "start_at": s.isoformat(),
+                "end_at": e.isoformat(),
+            }
+            for s, e, doctor in earliest_free_slots(doctors, after, max(limit, 1))
+        ]
         return Response(results)
 
-    
     @action(detail=True, methods=['get'], url_path='reviews')
     def reviews(self, request, slug=None):
         doctor = self.get_object()
@@ -223,6 +513,7 @@ class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
         overlapping_avails = DoctorAvailability.objects.filter(
             doctor=doctor_profile,
             weekday=weekday,
+            valid_from=serializer.validated_data.get('valid_from'),
             end_time__gt=start_time,
             start_time__lt=end_time
         )
@@ -236,6 +527,58 @@ class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Chỉ bác sĩ mới sửa lịch làm việc.")
         serializer.save(doctor=self.request.user.doctor_profile)
 
+    @action(detail=False, methods=['put'], url_path='week')
+    def week(self, request):
+        ser = DoctorWeekSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        data = ser.validated_data
+
+        u = request.user
+        if data.get('doctors'):
+            if not (u.is_staff or u.is_superuser):
+                raise PermissionDenied("Chỉ admin mới áp dụng lịch cho nhiều bác sĩ.")
+            # Bỏ id trùng để không tạo hai dòng lịch giống hệt nhau cho cùng bác sĩ
+            doctor_ids = list(dict.fromkeys(d.pk for d in data['doctors']))
+        elif hasattr(u, 'doctor_profile'):
+            doctor_ids = [u.doctor_profile.pk]
+        else:
+            raise PermissionDenied("Chỉ bác sĩ mới thiết lập lịch làm việc.")
+
+        valid_from, valid_to = data['valid_from'], data['valid_to']
+        existing = {
+            (av.doctor_id, av.weekday, av.start_time, av.end_time): av
+            for av in DoctorAvailability.objects.filter(doctor_id__in=doctor_ids, valid_from=valid_from)
+        }
+
+        to_create, to_update = [], []
+        for doctor_id in doctor_ids:
+            for w in data['windows']:
+                av = existing.pop((doctor_id, w['weekday'], w['start_time'], w['end_time']), None)
+                if av is None:
+                    to_create.append(DoctorAvailability(doctor_id=doctor_id, valid_from=valid_from, valid_to=valid_to, **w))
+                elif (av.slot_minutes, av.is_active, av.valid_to) != (w['slot_minutes'], w['is_active'], valid_to):
+                    av.slot_minutes, av.is_active, av.valid_to = w['slot_minutes'], w['is_active'], valid_to
+                    to_update.append(av)
+        to_delete = [av.pk for av in existing.values()]
+
+        with transaction.atomic(), batched_schedule_changes():
+            if to_delete:
+                DoctorAvailability.objects.filter(pk__in=to_delete).delete()
+            if to_update:
+                DoctorAvailability.objects.bulk_update(to_update, ['slot_minutes', 'is_active', 'valid_to'])
+            if to_create:
+                DoctorAvailability.objects.bulk_create(to_create)
+            if to_delete or to_update or to_create:
+                for doctor_id in doctor_ids:
+                    schedule_changed(doctor_id)
+
+        return Response({
+            "doctors": doctor_ids,
+            "created": len(to_create),
+            "updated": len(to_update),
+            "deleted": len(to_delete),
+        })
+
 class DoctorDayOffViewSet(viewsets.ModelViewSet):
     serializer_class = DoctorDayOffSerializer
     permission_classes = [IsAuthenticated]
@@ -273,9 +616,8 @@ class DoctorDayOffViewSet(viewsets.ModelViewSet):
         if serializer.validated_data['date'] < today:
             raise ValidationError("Không thể thêm lịch nghỉ trong quá khứ.")
         
-        day_off_instance = serializer.save(doctor=u.doctor_profile)
-        
-        self._adjust_doctor_availability_for_day_off_creation(day_off_instance)
+        # Lịch tuần (DoctorAvailability) giữ nguyên; ngày nghỉ được trừ ra khi tính slot
+        serializer.save(doctor=u.doctor_profile)
 
     def perform_update(self, serializer):
         u = self.request.user
@@ -295,49 +637,6 @@ class DoctorDayOffViewSet(viewsets.ModelViewSet):
         
         instance.delete()
 
-    def _adjust_doctor_availability_for_day_off_creation(self, day_off_instance):
-        doctor = day_off_instance.doctor
-        day_of_week = day_off_instance.date.weekday()
-        
-        day_off_start_time = day_off_instance.start_time if day_off_instance.start_time is not None else time.min
-        day_off_end_time = day_off_instance.end_time if day_off_instance.end_time is not None else time.max
-
-        overlapping_avails = DoctorAvailability.objects.filter(
-            doctor=doctor,
-            weekday=day_of_week,
-            is_active=True,
-            end_time__gt=day_off_start_time,
-            start_time__lt=day_off_end_time
-        ).order_by('start_time') 
-
-        for av in list(overlapping_avails):
-            av.delete()
-
-            new_segments = []
-
-            if av.start_time < day_off_start_time:
-                new_segments.append({
-                    'start_time': av.start_time,
-                    'end_time': day_off_start_time,
-                })
-
-            if av.end_time > day_off_end_time:
-                new_segments.append({
-                    'start_time': day_off_end_time,
-                    'end_time': av.end_time,
-                })
-            
-            for segment in new_segments:
-                if segment['start_time'] < segment['end_time']:
-                    DoctorAvailability.objects.create(
-                        doctor=doctor,
-                        weekday=day_of_week,
-                        start_time=segment['start_time'],
-                        end_time=segment['end_time'],
-                        slot_minutes=av.slot_minutes, 
-                        is_active=True 
-                    )
-
 class SpecialtyViewSet(viewsets.ModelViewSet):
     queryset = Specialty.objects.all().order_by("id")
     serializer_class = SpecialtySerializer
@@ -358,6 +657,52 @@ class SpecialtyViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Chỉ admin mới được quản lý chuyên khoa.")
         instance.delete()
 
+class RoomViewSet(viewsets.ModelViewSet):
+    queryset = Room.objects.all()
+    serializer_class = RoomSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def perform_create(self, serializer):
+        if not self.request.user.is_staff:
+            raise PermissionDenied("Chỉ admin mới được quản lý phòng khám.")
+        serializer.save()
+
+    def perform_update(self, serializer):
+        if not self.request.user.is_staff:
+            raise PermissionDenied("Chỉ admin mới được quản lý phòng khám.")
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        if not self.request.user.is_staff:
+            raise PermissionDenied("Chỉ admin mới được quản lý phòng khám.")
+        instance.delete()
+
+    @action(detail=True, methods=["get"])
+    def utilization(self, request, pk=None):
+        """Số phút mở cửa / đã đặt của phòng theo ngày (?date= hoặc ?start=&end=)."""
+        room = self.get_object()
+        start_date, end_date = _parse_date_range(request.query_params)
+
+        days = []
+        total_open = total_booked = 0
+        for d, open_minutes, booked_minutes in room_utilization(room, start_date, end_date):
+            total_open += open_minutes
+            total_booked += booked_minutes
+            days.append({
+                "date": d.isoformat(),
+                "open_minutes": open_minutes,
+                "booked_minutes": booked_minutes,
+                "utilization": round(booked_minutes / open_minutes, 4) if open_minutes else None,
+            })
+
+        return Response({
+            "room": RoomSerializer(room).data,
+            "open_minutes": total_open,
+            "booked_minutes": total_booked,
+            "utilization": round(total_booked / total_open, 4) if total_open else None,
+            "days": days,
+        })
+
 class DoctorReviewCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -0,0 +1,223 @@
+import json
+import platform
+import random
+import statistics
+import time as timer
+import tracemalloc
+from datetime import datetime, time, timedelta
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import CustomUser
+from appointments.models import Appointment
+from appointments.serializers import _ensure_within_availability_and_grid
+from doctors.api_views import DoctorViewSet
+from doctors.models import Doctor, DoctorAvailability
+from patients.models import Patient
+
+DAY_START = 7 * 60
+DAY_END = 21 * 60
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def _int_list(value):
+    try:
+        return [int(x) for x in value.split(",") if x.strip()]
+    except ValueError:
+        raise CommandError(f"Danh sách số không hợp lệ: {value}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Đo DoctorViewSet.slots và _ensure_within_availability_and_grid trên lịch sinh ngẫu nhiên "
+        "(wall time, số truy vấn, bộ nhớ đỉnh) và xuất kết quả JSON để so sánh với baseline. "
+        "Dữ liệu được tạo trong một transaction và rollback khi xong; cache bị tắt để đo đường tính toán."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", default="1,7,30,90", help="Các độ dài khoảng ngày, ví dụ 1,7,30,90.")
+        parser.add_argument("--windows", default="1,5,20", help="Số khung làm việc mỗi ngày.")
+        parser.add_argument("--bookings", default="0,50,500", help="Số lịch hẹn có sẵn trong khoảng ngày.")
+        parser.add_argument("--checks", type=int, default=200, help="Số lần gọi kiểm tra đặt lịch mỗi kịch bản.")
+        parser.add_argument("--repeat", type=int, default=3, help="Số lần lặp, lấy trung vị wall time.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Ghi JSON ra file thay vì stdout.")
+        parser.add_argument("--baseline", help="File JSON của lần chạy trước để so sánh.")
+        parser.add_argument(
+            "--fail-over", type=float, default=None,
+            help="Báo lỗi nếu có kịch bản chậm hơn baseline quá số phần trăm này.",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"], encoding="utf-8") as fh:
+                    baseline = {s["name"]: s for s in json.load(fh)["scenarios"]}
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Không đọc được baseline: {exc}")
+
+        self.rnd = random.Random(options["seed"])
+        self.repeat = max(1, options["repeat"])
+        self.factory = APIRequestFactory()
+        self.slots_view = DoctorViewSet.as_view({"get": "slots"})
+
+        scenarios = []
+        with override_settings(CACHES=NO_CACHE), transaction.atomic():
+            self.patient = self._patient()
+            start_date = timezone.localdate() + timedelta(days=1)
+            for days in _int_list(options["days"]):
+                for windows in _int_list(options["windows"]):
+                    for bookings in _int_list(options["bookings"]):
+                        doctor, spans = self._doctor(start_date, days, windows, bookings)
+                        params = {"days": days, "windows": windows, "bookings": bookings}
+                        scenarios.append(self._bench_slots(doctor, start_date, days, params))
+                        scenarios.append(self._bench_checks(doctor, spans, start_date, days, options["checks"], params))
+            transaction.set_rollback(True)
+
+        regressions = []
+        for s in scenarios:
+            base = baseline.get(s["name"]) if baseline else None
+            if base and base.get("wall_ms"):
+                s["baseline_wall_ms"] = base["wall_ms"]
+                s["delta_pct"] = round((s["wall_ms"] - base["wall_ms"]) / base["wall_ms"] * 100, 1)
+                if options["fail_over"] is not None and s["delta_pct"] > options["fail_over"]:
+                    regressions.append(s)
+
+        result = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "repeat": self.repeat,
+                "seed": options["seed"],
+            },
+            "scenarios": scenarios,
+        }
+
+        payload = json.dumps(result, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                fh.write(payload + "\n")
+            for s in scenarios:
+                delta = f" ({s['delta_pct']:+.1f}%)" if "delta_pct" in s else ""
+                self.stdout.write(f"{s['name']}: {s['wall_ms']} ms{delta}, {s['queries']} truy vấn, {s['peak_kb']} KB")
+            self.stdout.write(self.style.SUCCESS(f"Đã ghi {len(scenarios)} kịch bản vào {options['output']}."))
+        else:
+            self.stdout.write(payload)
+
+        if regressions:
+            names = ", ".join(s["name"] for s in regressions)
+            raise CommandError(f"Chậm hơn baseline quá {options['fail_over']}%: {names}")
+
+    def _patient(self):
+        user = CustomUser.objects.create_user(
+            email="benchmark-patient@medibook.local", password=None, full_name="Benchmark Patient", role="PATIENT"
+        )
+        return Patient.objects.create(user=user)
+
+    def _doctor(self, start_date, days, windows, bookings):
+        name = f"Benchmark {days}d {windows}w {bookings}b"
+        user = CustomUser.objects.create_user(
+            email=f"benchmark-{days}-{windows}-{bookings}@medibook.local",
+            password=None, full_name=name, role="DOCTOR",
+        )
+        doctor = Doctor.objects.create(user=user)
+
+        # Chia đều 07:00-21:00 thành `windows` khung liền nhau, slot 15 phút (hoặc cả khung nếu ngắn hơn)
+        length = (DAY_END - DAY_START) // windows
+        slot = min(15, length)
+        spans = []
+        rows = []
+        for i in range(windows):
+            s = DAY_START + i * length
+            spans.append((s, s + length, slot))
+            for weekday in range(7):
+                rows.append(DoctorAvailability(
+                    doctor=doctor, weekday=weekday, slot_minutes=slot,
+                    start_time=time(s // 60, s % 60), end_time=time((s + length) // 60, (s + length) % 60),
+                ))
+        DoctorAvailability.objects.bulk_create(rows)
+
+        tz = timezone.get_current_timezone()
+        appts = []
+        for _ in range(bookings):
+            day = start_date + timedelta(days=self.rnd.randrange(days))
+            w_start, w_end, w_slot = self.rnd.choice(spans)
+            m = w_start + self.rnd.randrange((w_end - w_start) // w_slot) * w_slot
+            s = timezone.make_aware(datetime.combine(day, time(m // 60, m % 60)), tz)
+            appts.append(Appointment(
+                doctor=doctor, patient=self.patient, start_at=s, end_at=s + timedelta(minutes=w_slot),
+                status=Appointment.Status.CONFIRMED,
+            ))
+        Appointment.objects.bulk_create(appts)
+
+        return doctor, spans
+
+    def _measure(self, fn):
+        times = []
+        for _ in range(self.repeat):
+            t0 = timer.perf_counter()
+            fn()
+            times.append(timer.perf_counter() - t0)
+
+        # queries_log giới hạn 9000 dòng, đầy thì CaptureQueriesContext đếm ra 0
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            fn()
+
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "wall_ms": round(statistics.median(times) * 1000, 3),
+            "queries": len(ctx.captured_queries),
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+    def _bench_slots(self, doctor, start_date, days, params):
+        end_date = start_date + timedelta(days=days - 1)
+        query = {"start": start_date.isoformat(), "end": end_date.isoformat()}
+
+        def run():
+            response = self.slots_view(self.factory.get("/", query), slug=doctor.slug)
+            response.render()
+            if response.status_code != 200:
+                raise CommandError(f"slots trả về {response.status_code}: {response.content[:200]}")
+
+        name = "slots/days={days}/windows={windows}/bookings={bookings}".format(**params)
+        return {"name": name, "target": "DoctorViewSet.slots", **params, **self._measure(run)}
+
+    def _bench_checks(self, doctor, spans, start_date, days, checks, params):
+        tz = timezone.get_current_timezone()
+        candidates = []
+        for _ in range(checks):
+            day = start_date + timedelta(days=self.rnd.randrange(days))
+            w_start, w_end, w_slot = self.rnd.choice(spans)
+            m = w_start + self.rnd.randrange((w_end - w_start) // w_slot) * w_slot
+            s = timezone.make_aware(datetime.combine(day, time(m // 60, m % 60)), tz)
+            candidates.append((s, s + timedelta(minutes=w_slot)))
+
+        def run():
+            for s, e in candidates:
+                try:
+                    _ensure_within_availability_and_grid(doctor, s, e)
+                except serializers.ValidationError:
+                    pass
+
+        name = "validate/days={days}/windows={windows}/bookings={bookings}".format(**params)
+        return {
+            "name": name, "target": "_ensure_within_availability_and_grid", "calls": checks,
+            **params, **self._measure(run),
+        }
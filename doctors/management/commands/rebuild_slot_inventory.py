@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.occupancy import rebuild_doctor_cells
+from doctors.models import Doctor
+from doctors.scheduling import rebuild_slot_inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Dựng lại bảng slot trống (DoctorSlot) và ô chiếm giờ (AppointmentCell) của lịch hẹn sắp tới "
+        "cho một bác sĩ hoặc toàn bộ bác sĩ đang hoạt động."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--doctor", help="Slug của bác sĩ cần dựng lại. Bỏ trống để chạy cho tất cả.")
+        parser.add_argument("--days", type=int, default=None, help="Số ngày của horizon (mặc định SLOT_INVENTORY_DAYS).")
+
+    def handle(self, *args, **options):
+        doctors = Doctor.objects.filter(is_active=True)
+        if options["doctor"]:
+            doctors = Doctor.objects.filter(slug=options["doctor"])
+            if not doctors.exists():
+                raise CommandError(f"Không tìm thấy bác sĩ '{options['doctor']}'.")
+
+        total = 0
+        for doctor in doctors.iterator():
+            # Ô buffer của lịch đã đặt được ghi lại theo buffer hiện tại (kể cả APPOINTMENT_BUFFER_MINUTES vừa đổi)
+            rebuild_doctor_cells(doctor)
+            count = rebuild_slot_inventory(doctor, options["days"])
+            total += count
+            self.stdout.write(f"{doctor.slug}: {count} slot đến {doctor.slot_inventory_until}")
+
+        self.stdout.write(self.style.SUCCESS(f"Đã dựng lại {total} slot."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from doctors.models import Doctor
+from doctors.scheduling import refresh_next_available
+
+
+class Command(BaseCommand):
+    help = (
+        "Cập nhật next_available_at cho các bác sĩ có mốc đã trôi qua hoặc chưa có mốc. "
+        "Nên chạy định kỳ (vài phút một lần) để thứ tự ?ordering=next_available luôn đúng."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Tính lại cho mọi bác sĩ đang hoạt động.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        doctors = Doctor.objects.filter(is_active=True)
+        if not options["all"]:
+            doctors = doctors.filter(Q(next_available_at__isnull=True) | Q(next_available_at__lte=now))
+
+        total = 0
+        for doctor_id in doctors.values_list("pk", flat=True).iterator():
+            refresh_next_available(doctor_id, now=now)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Đã cập nhật next_available_at cho {total} bác sĩ."))
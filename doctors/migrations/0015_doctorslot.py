@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0014_doctor_room_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='slot_inventory_until',
+            field=models.DateField(blank=True, help_text='Ngày cuối cùng đã có slot trống trong bảng DoctorSlot', null=True),
+        ),
+        migrations.CreateModel(
+            name='DoctorSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_at', models.DateTimeField()),
+                ('end_at', models.DateTimeField()),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_inventory', to='doctors.doctor')),
+            ],
+            options={
+                'ordering': ['doctor_id', 'start_at'],
+                'indexes': [models.Index(fields=['doctor', 'date', 'start_at'], name='doctors_doc_doctor__141513_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0015_doctorslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='schedule_version',
+            field=models.PositiveIntegerField(default=0, help_text='Tăng mỗi khi lịch hẹn, lịch làm việc hoặc lịch nghỉ thay đổi (dùng làm khóa cache slot)'),
+        ),
+    ]
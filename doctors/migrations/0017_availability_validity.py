@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0016_doctor_schedule_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctoravailability',
+            name='valid_from',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='doctoravailability',
+            name='valid_to',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='doctoravailability',
+            index=models.Index(fields=['doctor', 'weekday', 'valid_from'], name='doctors_doc_doctor__7aadfd_idx'),
+        ),
+    ]
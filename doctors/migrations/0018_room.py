@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_rooms(apps, schema_editor):
+    Doctor = apps.get_model('doctors', 'Doctor')
+    Room = apps.get_model('doctors', 'Room')
+    for doc in Doctor.objects.exclude(room_number__isnull=True).exclude(room_number=''):
+        code = "".join(doc.room_number.split()).upper()
+        if code:
+            doc.room, _ = Room.objects.get_or_create(code=code)
+            doc.save(update_fields=['room'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0017_availability_validity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Room',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='room',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='doctors', to='doctors.room'),
+        ),
+        migrations.RunPython(fill_rooms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0018_room'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='profile_version',
+            field=models.PositiveIntegerField(default=0, help_text='Tăng mỗi khi hồ sơ, tài khoản, chuyên khoa hoặc đánh giá của bác sĩ thay đổi (dùng cho ETag)'),
+        ),
+    ]
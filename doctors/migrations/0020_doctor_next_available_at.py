@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0019_doctor_profile_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='next_available_at',
+            field=models.DateTimeField(blank=True, help_text='Giờ bắt đầu của slot trống sớm nhất (None nếu không còn slot trong horizon)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['is_active', 'next_available_at'], name='doctors_doc_is_acti_3c78d7_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0020_doctor_next_available_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['date', 'start_time'],
+            },
+        ),
+    ]
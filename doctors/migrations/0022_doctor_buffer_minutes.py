@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0021_clinicclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='buffer_minutes',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Số phút nghỉ giữa hai lịch hẹn; để trống để dùng APPOINTMENT_BUFFER_MINUTES', null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from datetime import date, datetime
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from django.utils.text import slugify
@@ -27,15 +28,64 @@ class Doctor(models.Model):
         null=True,
         help_text="Số phòng khám hoặc phòng làm việc trong bệnh viện"
     )
+    room = models.ForeignKey(
+        "doctors.Room",
+        on_delete=models.SET_NULL,
+        related_name="doctors",
+        null=True, blank=True
+    )
+    buffer_minutes = models.PositiveSmallIntegerField(
+        blank=True,
+        null=True,
+        help_text="Số phút nghỉ giữa hai lịch hẹn; để trống để dùng APPOINTMENT_BUFFER_MINUTES"
+    )
+    slot_inventory_until = models.DateField(
+        blank=True,
+        null=True,
+        help_text="Ngày cuối cùng đã có slot trống trong bảng DoctorSlot"
+    )
+    schedule_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Tăng mỗi khi lịch hẹn, lịch làm việc hoặc lịch nghỉ thay đổi (dùng làm khóa cache slot)"
+    )
+    profile_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Tăng mỗi khi hồ sơ, tài khoản, chuyên khoa hoặc đánh giá của bác sĩ thay đổi (dùng cho ETag)"
+    )
+    next_available_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Giờ bắt đầu của slot trống sớm nhất (None nếu không còn slot trong horizon)"
+    )
+
+    # Các cột do hệ thống tự cập nhật bằng UPDATE riêng, không ghi đè khi lưu hồ sơ
+    SYSTEM_FIELDS = ("slot_inventory_until", "schedule_version", "profile_version", "next_available_at")
     
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.user.full_name)
+        # Phòng khám được chuẩn hóa thành Room để kiểm tra trùng phòng khi đặt lịch
+        code = Room.normalize_code(self.room_number)
+        if code is None:
+            self.room = None
+        elif self.room is None or self.room.code != code:
+            self.room, _ = Room.objects.get_or_create(code=code)
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.SYSTEM_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.user.full_name
 
+    @property
+    def booking_buffer_minutes(self):
+        if self.buffer_minutes is not None:
+            return self.buffer_minutes
+        return getattr(settings, "APPOINTMENT_BUFFER_MINUTES", 0)
+
     @property
     def phone_number(self):
         return self.user.phone_number
@@ -76,6 +126,23 @@ class Doctor(models.Model):
     class Meta:
         verbose_name = 'Doctor'
         verbose_name_plural = 'Doctors'
+        indexes = [models.Index(fields=["is_active", "next_available_at"])]
+
+class Room(models.Model):
+    code = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=100, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ["code"]
+
+    def __str__(self):
+        return self.name or self.code
+
+    @staticmethod
+    def normalize_code(value):
+        code = "".join((value or "").split()).upper()
+        return code or None
 
 class Specialty(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -102,13 +169,20 @@ class DoctorAvailability(models.Model):
     end_time = models.TimeField()
     slot_minutes = models.PositiveSmallIntegerField(default=30)
     is_active = models.BooleanField(default=True)
+    # Các dòng cùng valid_from tạo thành một phiên bản lịch tuần; bỏ trống = lịch gốc
+    valid_from = models.DateField(null=True, blank=True)
+    valid_to = models.DateField(null=True, blank=True)
 
     class Meta:
         ordering = ['doctor_id', 'weekday', 'start_time']
+        indexes = [models.Index(fields=['doctor', 'weekday', 'valid_from'])]
 
     def __str__(self):
         return f"Avail D#{self.doctor_id} wd={self.weekday} {self.start_time}-{self.end_time}"
 
+    def applies_on(self, day):
+        return (self.valid_from is None or self.valid_from <= day) and (self.valid_to is None or day <= self.valid_to)
+
 class DoctorDayOff(models.Model):
     doctor = models.ForeignKey('doctors.Doctor', on_delete=models.CASCADE, related_name='day_offs')
     date = models.DateField()
@@ -123,6 +197,33 @@ class DoctorDayOff(models.Model):
         rng = "full-day" if self.start_time is None else f"{self.start_time}-{self.end_time}"
         return f"DayOff D#{self.doctor_id} {self.date} {rng}"
 
+class ClinicClosure(models.Model):
+    """Ngày nghỉ chung của cả phòng khám (lễ, Tết...), áp dụng cho mọi bác sĩ bằng một dòng."""
+    date = models.DateField(db_index=True)
+    start_time = models.TimeField(null=True, blank=True)
+    end_time   = models.TimeField(null=True, blank=True)
+    reason = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ['date', 'start_time']
+
+    def __str__(self):
+        rng = "full-day" if self.start_time is None else f"{self.start_time}-{self.end_time}"
+        return f"Closure {self.date} {rng}"
+
+class DoctorSlot(models.Model):
+    doctor = models.ForeignKey('doctors.Doctor', on_delete=models.CASCADE, related_name='slot_inventory')
+    date = models.DateField()
+    start_at = models.DateTimeField()
+    end_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['doctor_id', 'start_at']
+        indexes = [models.Index(fields=['doctor', 'date', 'start_at'])]
+
+    def __str__(self):
+        return f"Slot D#{self.doctor_id} {self.start_at}-{self.end_at}"
+
 class DoctorReview(models.Model):
     appointment = models.OneToOneField(
         'appointments.Appointment',
@@ -0,0 +1,840 @@
+# doctors/scheduling.py
+import heapq
+import math
+import struct
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, time, date as date_cls
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from appointments.models import Appointment, SlotHold
+from .models import ClinicClosure, Doctor, DoctorAvailability, DoctorDayOff, DoctorSlot
+
+
+def _aware(d, t, tz):
+    return timezone.make_aware(datetime.combine(d, t), tz)
+
+
+def _merge(intervals):
+    """
+    Gộp các khoảng (start, end) chồng lấn hoặc liền kề. Đầu vào cần được sắp xếp theo start.
+    Kết quả có start và end đều tăng dần nên có thể bisect theo end.
+    """
+    merged = []
+    for s, e in intervals:
+        if merged and s <= merged[-1][1]:
+            if e > merged[-1][1]:
+                merged[-1][1] = e
+        else:
+            merged.append([s, e])
+    return merged
+
+
+def _mins(t):
+    return t.hour * 60 + t.minute
+
+
+def _bit_runs(bits):
+    """Các đoạn bit 1 liên tiếp (start, end) của một số nguyên, từ bit thấp lên cao."""
+    while bits:
+        low = bits & -bits
+        start = low.bit_length() - 1
+        filled = bits + low
+        yield start, start + (bits & ~filled).bit_count()
+        bits &= filled
+
+
+class DayGrid:
+    """
+    Lịch một ngày dưới dạng bitmap, mỗi bit là một phút (bit i = phút thứ i kể từ 00:00):
+    work (giờ làm việc), off (nghỉ) và busy (đã có lịch hẹn).
+    Kiểm tra slot trống, trùng giờ nghỉ hay trùng lịch đều là phép AND/OR trên số nguyên.
+    """
+
+    MINUTES = 24 * 60
+    NBYTES = MINUTES // 8
+    DAY_MASK = (1 << MINUTES) - 1
+    _HEADER = struct.Struct(">I?B")
+    _WINDOW = struct.Struct(">HHH")
+
+    def __init__(self, day, windows=(), work=0, off=0, busy=0, full_day_off=False):
+        self.date = day
+        self.windows = list(windows)
+        self.work = work
+        self.off = off
+        self.busy = busy
+        self.full_day_off = full_day_off
+
+    @staticmethod
+    def mask(start_min, end_min):
+        start_min = max(start_min, 0)
+        end_min = min(end_min, DayGrid.MINUTES)
+        if end_min <= start_min:
+            return 0
+        return ((1 << (end_min - start_min)) - 1) << start_min
+
+    @property
+    def free(self):
+        return self.work & ~self.off & ~self.busy
+
+    def window_for(self, start_min, end_min):
+        for w in self.windows:
+            if w[0] <= start_min and w[1] >= end_min:
+                return w
+        return None
+
+    def slots(self):
+        """Các slot trống (phút bắt đầu, phút kết thúc) theo lưới của từng khung làm việc."""
+        if self.full_day_off:
+            return []
+        free = self.free
+        out = []
+        for w_start, w_end, slot in self.windows:
+            full = (1 << slot) - 1
+            m = w_start
+            while m + slot <= w_end:
+                if (free >> m) & full == full:
+                    out.append((m, m + slot))
+                m += slot
+        return out
+
+    def runs(self, duration):
+        """
+        Các khoảng (phút bắt đầu, phút kết thúc) dài đúng `duration` phút đặt được trong một lịch hẹn:
+        nằm trọn trong một khung, khớp lưới slot và duration là bội số của slot_minutes.
+        Duyệt một lượt các đoạn trống liên tiếp (đã gộp sẵn trong bitmap) thay vì ghép từng cặp slot.
+        """
+        if self.full_day_off or duration <= 0:
+            return []
+        free = self.free
+        out = []
+        for w_start, w_end, slot in self.windows:
+            if duration % slot:
+                continue
+            for r_start, r_end in _bit_runs(free & self.mask(w_start, w_end)):
+                m = w_start + -(-(r_start - w_start) // slot) * slot
+                while m + duration <= r_end:
+                    out.append((m, m + duration))
+                    m += slot
+        out.sort()
+        return out
+
+    def free_slot_count(self, now_min=None):
+        """
+        Đếm số slot trống mà không sinh từng slot: với mỗi khung làm việc, lấy số slot theo lưới
+        trừ đi các chỉ số slot bị các đoạn bận/nghỉ chạm vào (và các slot đã kết thúc trước now_min).
+        Chi phí O(khung + đoạn bận) mỗi ngày.
+        """
+        if self.full_day_off:
+            return 0
+        blocked = self.off | self.busy
+        total = 0
+        for w_start, w_end, slot in self.windows:
+            n = (w_end - w_start) // slot
+            if n <= 0:
+                continue
+            taken_upto = 0
+            if now_min is not None:
+                taken_upto = min(max(math.floor((now_min - w_start) / slot), 0), n)
+            lost = taken_upto
+            for r_start, r_end in _bit_runs(blocked & self.mask(w_start, w_start + n * slot)):
+                first = max((r_start - w_start) // slot, taken_upto)
+                last = (r_end - 1 - w_start) // slot
+                if last >= first:
+                    lost += last - first + 1
+                    taken_upto = last + 1
+            total += n - lost
+        return total
+
+    def to_bytes(self):
+        parts = [self._HEADER.pack(self.date.toordinal(), self.full_day_off, len(self.windows))]
+        parts += [self._WINDOW.pack(*w) for w in self.windows]
+        parts += [bits.to_bytes(self.NBYTES, "big") for bits in (self.work, self.off, self.busy)]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        ordinal, full_day_off, n = cls._HEADER.unpack_from(data)
+        pos = cls._HEADER.size
+        windows = []
+        for _ in range(n):
+            windows.append(cls._WINDOW.unpack_from(data, pos))
+            pos += cls._WINDOW.size
+        bits = []
+        for _ in range(3):
+            bits.append(int.from_bytes(data[pos:pos + cls.NBYTES], "big"))
+            pos += cls.NBYTES
+        return cls(date_cls.fromordinal(ordinal), windows, *bits, full_day_off=full_day_off)
+
+
+def _availabilities(start_date, end_date, **filters):
+    """Các dòng lịch tuần có hiệu lực giao với [start_date, end_date] (một truy vấn cho cả khoảng)."""
+    return (
+        DoctorAvailability.objects.filter(is_active=True, **filters)
+        .filter(Q(valid_from__isnull=True) | Q(valid_from__lte=end_date))
+        .filter(Q(valid_to__isnull=True) | Q(valid_to__gte=start_date))
+        .order_by("start_time")
+    )
+
+
+def windows_on(availabilities, day):
+    """
+    Các khung (start, end, slot) của bác sĩ trong ngày `day`.
+    Trong các phiên bản lịch tuần đang có hiệu lực, phiên bản có valid_from muộn nhất được dùng cho cả tuần
+    (ngày không có khung trong phiên bản đó là ngày nghỉ); vì vậy phiên bản mới chỉ tạo qua availability/week/.
+    """
+    applicable = [av for av in availabilities if av.applies_on(day)]
+    if not applicable:
+        return []
+    version = max((av.valid_from for av in applicable if av.valid_from), default=None)
+    return [
+        (_mins(av.start_time), _mins(av.end_time), av.slot_minutes)
+        for av in applicable
+        if av.valid_from == version and av.weekday == day.weekday()
+    ]
+
+
+def _day_offs(start_date, end_date, **filters):
+    return DoctorDayOff.objects.filter(date__gte=start_date, date__lte=end_date, **filters)
+
+
+def clinic_closures(start_date=None, end_date=None):
+    """
+    {date: [ClinicClosure]} của cả phòng khám trong khoảng ngày (bỏ trống = cả bảng).
+    Luôn đọc từ DB bằng một truy vấn theo index date: cache cục bộ (LocMemCache) chỉ được xóa ở
+    worker đã lưu thay đổi, các worker khác sẽ dựng slot theo lịch nghỉ cũ dưới schedule_version mới.
+    """
+    rows = ClinicClosure.objects.all()
+    if start_date is not None:
+        rows = rows.filter(date__gte=start_date)
+    if end_date is not None:
+        rows = rows.filter(date__lte=end_date)
+    out = defaultdict(list)
+    for closure in rows:
+        out[closure.date].append(closure)
+    return out
+
+
+def _taken(start_date, end_date, tz, margin=timedelta(0), **filters):
+    # margin: lấy thêm lịch hẹn sát hai đầu khoảng để buffer của chúng tràn sang ngày được tính
+    range_start = _aware(start_date, time.min, tz) - margin
+    range_end = _aware(end_date + timedelta(days=1), time.min, tz) + margin
+    return (
+        Appointment.objects.filter(start_at__lt=range_end, end_at__gt=range_start, **filters)
+        .exclude(status=Appointment.Status.CANCELLED)
+        .order_by("start_at")
+    )
+
+
+class DoctorSchedule:
+    """
+    Lịch làm việc, lịch nghỉ và lịch hẹn của một bác sĩ trong khoảng [start_date, end_date],
+    được nạp bằng đúng 4 truy vấn (kể cả ngày nghỉ chung). Mỗi ngày sau đó được dựng thành DayGrid trong bộ nhớ;
+    busy đã gồm buffer (Doctor.booking_buffer_minutes) trước và sau mỗi lịch hẹn.
+    """
+
+    def __init__(self, doctor, start_date, end_date, tz=None, availabilities=None, day_offs=None, taken=None,
+                 closures=None):
+        self.doctor = doctor
+        self.start_date = start_date
+        self.end_date = end_date
+        self.tz = tz or timezone.get_current_timezone()
+
+        if availabilities is None:
+            availabilities = _availabilities(start_date, end_date, doctor_id=doctor.pk)
+        if day_offs is None:
+            day_offs = _day_offs(start_date, end_date, doctor_id=doctor.pk)
+        buffer = timedelta(minutes=doctor.booking_buffer_minutes)
+        if taken is None:
+            taken = _taken(start_date, end_date, self.tz, buffer, doctor_id=doctor.pk).values_list("start_at", "end_at")
+        if closures is None:
+            closures = clinic_closures(start_date, end_date)
+
+        self.availabilities = list(availabilities)
+
+        # Ngày nghỉ chung của phòng khám có cùng dạng (date, start_time, end_time) với DoctorDayOff
+        blocked = list(day_offs)
+        for day, rows in closures.items():
+            if start_date <= day <= end_date:
+                blocked.extend(rows)
+
+        self.full_day_offs = set()
+        self.off_times = defaultdict(list)
+        for off in blocked:
+            if off.start_time is None and off.end_time is None:
+                self.full_day_offs.add(off.date)
+            elif off.start_time and off.end_time:
+                self.off_times[off.date].append((_mins(off.start_time), _mins(off.end_time)))
+
+        # Nới mỗi lịch hẹn thêm buffer hai phía một lần khi nạp, để slot sát lịch hẹn bị chặn
+        # giống hệt kiểm tra lúc đặt lịch mà không tốn thêm chi phí cho từng slot
+        if buffer:
+            taken = [(s - buffer, e + buffer) for s, e in taken]
+        self.busy = _merge(taken)
+        self._busy_ends = [e for _, e in self.busy]
+
+    @classmethod
+    def for_doctors(cls, doctors, start_date, end_date, tz=None):
+        """Nạp lịch của nhiều bác sĩ cùng lúc, vẫn chỉ 4 truy vấn (doctor_id__in)."""
+        tz = tz or timezone.get_current_timezone()
+        ids = [d.pk for d in doctors]
+
+        avails = defaultdict(list)
+        for av in _availabilities(start_date, end_date, doctor_id__in=ids):
+            avails[av.doctor_id].append(av)
+
+        offs = defaultdict(list)
+        for off in _day_offs(start_date, end_date, doctor_id__in=ids):
+            offs[off.doctor_id].append(off)
+
+        taken = defaultdict(list)
+        margin = timedelta(minutes=max((d.booking_buffer_minutes for d in doctors), default=0))
+        rows = _taken(start_date, end_date, tz, margin, doctor_id__in=ids).values_list("doctor_id", "start_at", "end_at")
+        for doctor_id, s, e in rows:
+            taken[doctor_id].append((s, e))
+
+        closures = clinic_closures(start_date, end_date)
+        return {
+            d.pk: cls(d, start_date, end_date, tz, avails[d.pk], offs[d.pk], taken[d.pk], closures)
+            for d in doctors
+        }
+
+    def day_grid(self, target_date):
+        windows = windows_on(self.availabilities, target_date)
+        grid = DayGrid(target_date, windows, full_day_off=target_date in self.full_day_offs)
+        if grid.full_day_off:
+            grid.off = DayGrid.DAY_MASK
+
+        for w_start, w_end, _ in windows:
+            grid.work |= DayGrid.mask(w_start, w_end)
+        for o_start, o_end in self.off_times.get(target_date, ()):
+            grid.off |= DayGrid.mask(o_start, o_end)
+
+        day_start = _aware(target_date, time.min, self.tz)
+        day_end = _aware(target_date + timedelta(days=1), time.min, self.tz)
+        i = bisect_right(self._busy_ends, day_start)
+        while i < len(self.busy) and self.busy[i][0] < day_end:
+            b_start, b_end = self.busy[i]
+            # Làm tròn ra ngoài để lịch hẹn lệch phút vẫn chặn trọn các phút nó chạm tới
+            s_min = math.floor((b_start - day_start).total_seconds() / 60)
+            e_min = math.ceil((b_end - day_start).total_seconds() / 60)
+            grid.busy |= DayGrid.mask(s_min, e_min)
+            i += 1
+        return grid
+
+    def day_slots(self, target_date, now=None):
+        """Trả về danh sách (start, end) các slot còn trống của một ngày."""
+        grid = self.day_grid(target_date)
+        day_start = _aware(target_date, time.min, self.tz)
+        slots = []
+        for s_min, e_min in grid.slots():
+            slot_end = day_start + timedelta(minutes=e_min)
+            if now is None or slot_end > now:
+                slots.append((day_start + timedelta(minutes=s_min), slot_end))
+        return slots
+
+    def iter_days(self):
+        d = self.start_date
+        while d <= self.end_date:
+            yield d
+            d += timedelta(days=1)
+
+
+def doctor_agenda(doctor, start_date, end_date, now=None, tz=None):
+    """
+    [(date, [(start, end, kind, obj)])] theo thứ tự thời gian, kind là "appointment", "free" hoặc "blocked"
+    (obj là DoctorDayOff hoặc ClinicClosure).
+    Luôn 4 truy vấn bất kể số lịch hẹn: lịch tuần, lịch nghỉ, ngày nghỉ chung và lịch hẹn (kèm bệnh nhân).
+    """
+    tz = tz or timezone.get_current_timezone()
+    appts = list(_taken(start_date, end_date, tz, doctor_id=doctor.pk).select_related("patient__user"))
+    day_offs = list(_day_offs(start_date, end_date, doctor_id=doctor.pk))
+    closures = clinic_closures(start_date, end_date)
+    schedule = DoctorSchedule(
+        doctor, start_date, end_date, tz, day_offs=day_offs, taken=[(a.start_at, a.end_at) for a in appts],
+        closures=closures,
+    )
+    for day, rows in closures.items():
+        if start_date <= day <= end_date:
+            day_offs.extend(rows)
+
+    entries = defaultdict(list)
+    for a in appts:
+        s, e = timezone.localtime(a.start_at, tz), timezone.localtime(a.end_at, tz)
+        entries[max(s.date(), start_date)].append((s, e, "appointment", a))
+    for off in day_offs:
+        if off.start_time is None and off.end_time is None:
+            s, e = _aware(off.date, time.min, tz), _aware(off.date + timedelta(days=1), time.min, tz)
+        elif off.start_time and off.end_time:
+            s, e = _aware(off.date, off.start_time, tz), _aware(off.date, off.end_time, tz)
+        else:
+            continue
+        entries[off.date].append((s, e, "blocked", off))
+
+    out = []
+    for d in schedule.iter_days():
+        day = entries.get(d, []) + [(s, e, "free", None) for s, e in schedule.day_slots(d, now)]
+        day.sort(key=lambda x: (x[0], x[1]))
+        out.append((d, day))
+    return out
+
+
+def free_slot_counts(doctors, start_date, end_date, now=None, tz=None):
+    """{doctor_id: {date: số slot trống}} tính bằng DayGrid.free_slot_count, không sinh danh sách slot."""
+    tz = tz or timezone.get_current_timezone()
+    now = now or timezone.now()
+    today = timezone.localtime(now, tz).date()
+    now_min = (timezone.localtime(now, tz) - _aware(today, time.min, tz)).total_seconds() / 60
+
+    out = {}
+    for doctor_id, schedule in DoctorSchedule.for_doctors(doctors, start_date, end_date, tz).items():
+        counts = {}
+        for d in schedule.iter_days():
+            if d < today:
+                counts[d] = 0
+            else:
+                counts[d] = schedule.day_grid(d).free_slot_count(now_min if d == today else None)
+        out[doctor_id] = counts
+    return out
+
+
+def room_utilization(room, start_date, end_date, tz=None):
+    """
+    [(date, open_minutes, booked_minutes)] của một phòng. Giờ mở = OR giờ làm (trừ giờ nghỉ) của các
+    bác sĩ gắn với phòng, giờ đã đặt = OR các lịch hẹn trong phòng; cả hai là popcount trên bitmap phút.
+    """
+    tz = tz or timezone.get_current_timezone()
+    doctors = list(Doctor.objects.filter(room=room))
+    schedules = DoctorSchedule.for_doctors(doctors, start_date, end_date, tz).values()
+    booked = _merge(_taken(start_date, end_date, tz, room_id=room.pk).values_list("start_at", "end_at"))
+    booked_ends = [e for _, e in booked]
+
+    out = []
+    d = start_date
+    while d <= end_date:
+        open_bits = 0
+        for schedule in schedules:
+            grid = schedule.day_grid(d)
+            open_bits |= grid.work & ~grid.off
+        day_start = _aware(d, time.min, tz)
+        day_end = _aware(d + timedelta(days=1), time.min, tz)
+        busy_bits = 0
+        # Như DoctorSchedule.day_grid: chỉ duyệt các khoảng đã đặt chạm tới ngày này
+        i = bisect_right(booked_ends, day_start)
+        while i < len(booked) and booked[i][0] < day_end:
+            b_start, b_end = booked[i]
+            s_min = math.floor((b_start - day_start).total_seconds() / 60)
+            e_min = math.ceil((b_end - day_start).total_seconds() / 60)
+            busy_bits |= DayGrid.mask(s_min, e_min)
+            i += 1
+        out.append((d, open_bits.bit_count(), busy_bits.bit_count()))
+        d += timedelta(days=1)
+    return out
+
+
+def grid_cache_key(doctor, target_date):
+    return f"grid:{doctor.pk}:v{doctor.schedule_version}:{target_date.isoformat()}"
+
+
+def day_grids(doctor, start_date, end_date, tz=None):
+    """
+    {date: DayGrid} cho khoảng ngày, cache dạng bytes theo (bác sĩ, schedule_version, ngày).
+    Các ngày chưa có trong cache được dựng bằng một DoctorSchedule chung (4 truy vấn).
+    """
+    days = []
+    d = start_date
+    while d <= end_date:
+        days.append(d)
+        d += timedelta(days=1)
+
+    keys = {d: grid_cache_key(doctor, d) for d in days}
+    cached = cache.get_many(list(keys.values()))
+    out = {d: DayGrid.from_bytes(cached[key]) for d, key in keys.items() if key in cached}
+
+    missing = [d for d in days if d not in out]
+    if missing:
+        schedule = DoctorSchedule(doctor, missing[0], missing[-1], tz)
+        for d in missing:
+            out[d] = schedule.day_grid(d)
+        cache.set_many(
+            {keys[d]: out[d].to_bytes() for d in missing}, getattr(settings, "SLOT_CACHE_TIMEOUT", 60 * 60 * 24)
+        )
+    return out
+
+
+def day_grid(doctor, target_date):
+    """DayGrid của một ngày (xem day_grids)."""
+    return day_grids(doctor, target_date, target_date)[target_date]
+
+
+def held_intervals(doctors, start_date, end_date, now=None, tz=None):
+    """
+    {doctor_id: [[start, end], ...]} các khoảng đang được giữ chỗ (SlotHold còn hạn), đã nới theo buffer
+    của bác sĩ và gộp lại. Một truy vấn; lượt giữ hết hạn bị bỏ qua ngay lúc đọc.
+    """
+    tz = tz or timezone.get_current_timezone()
+    now = now or timezone.now()
+    by_id = {d.pk: d for d in doctors}
+    rows = (
+        SlotHold.objects.filter(
+            doctor_id__in=list(by_id), expires_at__gt=now,
+            start_at__lt=_aware(end_date + timedelta(days=1), time.min, tz), end_at__gt=_aware(start_date, time.min, tz),
+        )
+        .order_by("start_at")
+        .values_list("doctor_id", "start_at", "end_at")
+    )
+    spans = defaultdict(list)
+    for doctor_id, s, e in rows:
+        buffer = timedelta(minutes=by_id[doctor_id].booking_buffer_minutes)
+        spans[doctor_id].append((s - buffer, e + buffer))
+    return {doctor_id: _merge(items) for doctor_id, items in spans.items()}
+
+
+def _without_held(day_slots, held):
+    if not held:
+        return day_slots
+    ends = [e for _, e in held]
+    out = []
+    for s, e in day_slots:
+        i = bisect_right(ends, s)
+        if i < len(held) and held[i][0] < e:
+            continue
+        out.append((s, e))
+    return out
+
+
+def free_runs(doctor, start_date, end_date, duration, now=None, tz=None, hide_held=False):
+    """
+    (date, [(start, end), ...]) các giờ bắt đầu đặt được một lịch hẹn dài `duration` phút, theo DayGrid.runs.
+    Giờ bắt đầu trước `now` bị bỏ vì không đặt được lịch trong quá khứ.
+    """
+    tz = tz or timezone.get_current_timezone()
+    grids = day_grids(doctor, start_date, end_date, tz)
+    held = held_intervals([doctor], start_date, end_date, now, tz).get(doctor.pk) if hide_held else None
+    out = []
+    for d in sorted(grids):
+        day_start = _aware(d, time.min, tz)
+        runs = [(day_start + timedelta(minutes=s), day_start + timedelta(minutes=e)) for s, e in grids[d].runs(duration)]
+        if now is not None:
+            runs = [(s, e) for s, e in runs if s >= now]
+        out.append((d, _without_held(runs, held)))
+    return out
+
+
+def inventory_covers(doctor, end_date):
+    return doctor.slot_inventory_until is not None and end_date <= doctor.slot_inventory_until
+
+
+def _compute_days(doctors, start_date, end_date, tz):
+    """
+    {doctor_id: {date: slots}} chưa lọc theo giờ hiện tại. Bác sĩ đã có DoctorSlot phủ khoảng này
+    được đọc bằng một range scan chung, số còn lại tính bằng DoctorSchedule.for_doctors.
+    """
+    out = {}
+    covered = [d.pk for d in doctors if inventory_covers(d, end_date)]
+    others = [d for d in doctors if not inventory_covers(d, end_date)]
+
+    if covered:
+        for doctor_id in covered:
+            out[doctor_id] = defaultdict(list)
+        rows = DoctorSlot.objects.filter(doctor_id__in=covered, date__gte=start_date, date__lte=end_date)
+        for doctor_id, d, s, e in rows.order_by("start_at").values_list("doctor_id", "date", "start_at", "end_at"):
+            out[doctor_id][d].append((timezone.localtime(s, tz), timezone.localtime(e, tz)))
+
+    if others:
+        for doctor_id, schedule in DoctorSchedule.for_doctors(others, start_date, end_date, tz).items():
+            out[doctor_id] = {d: schedule.day_slots(d) for d in schedule.iter_days()}
+
+    return out
+
+
+def slot_cache_key(doctor, target_date):
+    return f"slots:{doctor.pk}:v{doctor.schedule_version}:{target_date.isoformat()}"
+
+
+def _count_cache(name, n):
+    if not n:
+        return
+    key = f"slots:stats:{name}"
+    try:
+        cache.incr(key, n)
+    except ValueError:
+        if not cache.add(key, n, None):
+            cache.incr(key, n)
+
+
+def slot_cache_stats():
+    stats = cache.get_many(["slots:stats:hits", "slots:stats:misses"])
+    hits = stats.get("slots:stats:hits", 0)
+    misses = stats.get("slots:stats:misses", 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
+
+
+def bump_schedule_version(doctor_id):
+    """Đổi version để mọi slot đã cache của bác sĩ này tự động hết hiệu lực."""
+    Doctor.objects.filter(pk=doctor_id).update(schedule_version=F("schedule_version") + 1)
+
+
+def free_slots_many(doctors, start_date, end_date, now=None, tz=None, hide_held=False, count_stats=False):
+    """
+    {doctor_id: [(date, [(start, end), ...]), ...]} cho nhiều bác sĩ.
+    Mỗi ngày được cache theo (bác sĩ, schedule_version, ngày); các ngày chưa có trong cache
+    được đọc từ DoctorSlot (một range scan) hoặc tính bằng DoctorSchedule, với số truy vấn cố định.
+    hide_held=True lọc bỏ slot đang được giữ chỗ lúc đọc (không nằm trong cache).
+    count_stats=True chỉ dùng cho đường đọc công khai (API slots) để tỉ lệ hit/miss không bị
+    lẫn các lần đọc nội bộ như refresh_next_available hay gợi ý giờ khác.
+    """
+    tz = tz or timezone.get_current_timezone()
+
+    days = []
+    d = start_date
+    while d <= end_date:
+        days.append(d)
+        d += timedelta(days=1)
+
+    keys = {(doctor.pk, d): slot_cache_key(doctor, d) for doctor in doctors for d in days}
+    cached = cache.get_many(list(keys.values()))
+    missing = [k for k, key in keys.items() if key not in cached]
+    if count_stats:
+        _count_cache("hits", len(keys) - len(missing))
+        _count_cache("misses", len(missing))
+
+    computed = {}
+    if missing:
+        missing_ids = {doctor_id for doctor_id, _ in missing}
+        missing_days = [d for _, d in missing]
+        computed = _compute_days(
+            [doctor for doctor in doctors if doctor.pk in missing_ids],
+            min(missing_days), max(missing_days), tz,
+        )
+        timeout = getattr(settings, "SLOT_CACHE_TIMEOUT", 60 * 60 * 24)
+        cache.set_many({keys[k]: computed[k[0]].get(k[1], []) for k in missing}, timeout)
+
+    held = held_intervals(doctors, start_date, end_date, now, tz) if hide_held else {}
+
+    out = {}
+    for doctor in doctors:
+        out[doctor.pk] = []
+        for d in days:
+            key = keys[(doctor.pk, d)]
+            day_slots = cached[key] if key in cached else computed[doctor.pk].get(d, [])
+            if now is not None:
+                day_slots = [(s, e) for s, e in day_slots if e > now]
+            out[doctor.pk].append((d, _without_held(day_slots, held.get(doctor.pk))))
+    return out
+
+
+def free_slots(doctor, start_date, end_date, now=None, tz=None, hide_held=False, count_stats=False):
+    """(date, [(start, end), ...]) cho từng ngày trong khoảng của một bác sĩ."""
+    return free_slots_many([doctor], start_date, end_date, now, tz, hide_held, count_stats)[doctor.pk]
+
+
+def iter_free_slots(doctor, after, horizon_days=None, chunk_days=7, tz=None):
+    """
+    Sinh lần lượt (start, end) các slot trống bắt đầu từ thời điểm `after`,
+    nạp dữ liệu theo từng đoạn chunk_days ngày để có thể dừng sớm. Slot đang được giữ chỗ bị bỏ qua.
+    """
+    tz = tz or timezone.get_current_timezone()
+    horizon_days = horizon_days or getattr(settings, "SLOT_INVENTORY_DAYS", 60)
+    now = max(after, timezone.now())
+    first = timezone.localtime(after, tz).date()
+    last = first + timedelta(days=horizon_days - 1)
+
+    chunk_start = first
+    while chunk_start <= last:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), last)
+        for _, day_slots in free_slots(doctor, chunk_start, chunk_end, now, tz, hide_held=True):
+            for s, e in day_slots:
+                if s >= after:
+                    yield s, e
+        chunk_start = chunk_end + timedelta(days=1)
+
+
+def earliest_free_slots(doctors, after, limit, horizon_days=None):
+    """
+    Gộp k luồng slot trống (mỗi bác sĩ một luồng) bằng heap và lấy `limit` slot sớm nhất.
+    Mỗi luồng chỉ nạp thêm dữ liệu khi heap cần tới phần tử tiếp theo của nó.
+    """
+    def stream(doctor):
+        for s, e in iter_free_slots(doctor, after, horizon_days):
+            yield s, e, doctor
+
+    streams = [stream(doctor) for doctor in doctors]
+    return list(islice(heapq.merge(*streams, key=lambda item: item[0]), limit))
+
+
+def _write_inventory(doctor, start_date, end_date, dates=None):
+    schedule = DoctorSchedule(doctor, start_date, end_date)
+    days = sorted(dates) if dates is not None else list(schedule.iter_days())
+    rows = [
+        DoctorSlot(doctor=doctor, date=d, start_at=s, end_at=e)
+        for d in days
+        for s, e in schedule.day_slots(d)
+    ]
+
+    stale = DoctorSlot.objects.filter(doctor=doctor)
+    if dates is not None:
+        stale = stale.filter(date__in=days)
+    else:
+        stale = stale.filter(date__gte=start_date, date__lte=end_date)
+
+    with transaction.atomic():
+        stale.delete()
+        DoctorSlot.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_slot_inventory(doctor, days=None):
+    """
+    Dựng lại toàn bộ slot trống của bác sĩ từ hôm nay đến hết horizon. Đồng thời tăng schedule_version
+    để cache/ETag cũ hết hiệu lực (ví dụ sau khi đổi APPOINTMENT_BUFFER_MINUTES).
+    """
+    days = days or getattr(settings, "SLOT_INVENTORY_DAYS", 60)
+    today = timezone.localdate()
+    until = today + timedelta(days=days - 1)
+
+    with transaction.atomic():
+        DoctorSlot.objects.filter(doctor=doctor).exclude(date__gte=today, date__lte=until).delete()
+        count = _write_inventory(doctor, today, until)
+        Doctor.objects.filter(pk=doctor.pk).update(
+            slot_inventory_until=until, schedule_version=F("schedule_version") + 1
+        )
+    doctor.slot_inventory_until = until
+    return count
+
+
+def refresh_slot_inventory(doctor_id, dates=None):
+    """
+    Cập nhật lại slot trống của một số ngày (hoặc cả horizon nếu dates=None)
+    sau khi lịch làm việc, lịch nghỉ hoặc lịch hẹn thay đổi.
+    """
+    doctor = Doctor.objects.filter(pk=doctor_id, slot_inventory_until__isnull=False).first()
+    if doctor is None:
+        return
+
+    today = timezone.localdate()
+    if dates is None:
+        _write_inventory(doctor, today, doctor.slot_inventory_until)
+        return
+
+    dates = {d for d in dates if today <= d <= doctor.slot_inventory_until}
+    if dates:
+        _write_inventory(doctor, min(dates), max(dates), dates)
+
+
+def _rewrite_inventory_day(target_date):
+    """Dựng lại DoctorSlot của một ngày cho mọi bác sĩ có inventory, 4 truy vấn đọc + 1 DELETE + 1 INSERT."""
+    doctors = list(Doctor.objects.filter(slot_inventory_until__gte=target_date))
+    if not doctors:
+        return
+    rows = [
+        DoctorSlot(doctor_id=doctor_id, date=target_date, start_at=s, end_at=e)
+        for doctor_id, schedule in DoctorSchedule.for_doctors(doctors, target_date, target_date).items()
+        for s, e in schedule.day_slots(target_date)
+    ]
+    with transaction.atomic():
+        DoctorSlot.objects.filter(doctor_id__in=[d.pk for d in doctors], date=target_date).delete()
+        DoctorSlot.objects.bulk_create(rows, batch_size=1000)
+
+
+def clinic_closures_changed(dates):
+    """
+    Gọi sau khi thêm, sửa hoặc xóa ngày nghỉ chung. Không ghi gì theo từng bác sĩ:
+    đổi schedule_version của mọi bác sĩ bằng một UPDATE và dựng lại DoctorSlot của các ngày bị ảnh hưởng.
+    Sau khi commit, next_available_at được tính lại cho các bác sĩ có mốc từ ngày sớm nhất bị ảnh hưởng trở đi
+    (mốc có thể lùi khi thêm ngày nghỉ hoặc sớm lên khi xóa/dời ngày nghỉ).
+    """
+    today = timezone.localdate()
+    for d in sorted(dates):
+        if d >= today:
+            _rewrite_inventory_day(d)
+    # Như schedule_changed: chỉ đổi version sau khi DoctorSlot đã đúng
+    Doctor.objects.update(schedule_version=F("schedule_version") + 1)
+
+    first = _aware(min(dates), time.min, timezone.get_current_timezone())
+
+    def refresh():
+        for doctor_id in Doctor.objects.filter(next_available_at__gte=first).values_list("pk", flat=True):
+            refresh_next_available(doctor_id, dates)
+
+    transaction.on_commit(refresh)
+
+
+def refresh_next_available(doctor_id, dates=None, now=None):
+    """
+    Tính lại Doctor.next_available_at (giờ bắt đầu slot trống sớm nhất từ bây giờ, bỏ qua slot đang được giữ).
+    Nếu mọi ngày thay đổi đều sau ngày của mốc hiện tại thì mốc không thể đổi nên bỏ qua.
+    """
+    now = now or timezone.now()
+    doctor = Doctor.objects.filter(pk=doctor_id).first()
+    if doctor is None:
+        return None
+
+    current = doctor.next_available_at
+    if dates is not None and current is not None and current > now:
+        if not dates or min(dates) > timezone.localtime(current).date():
+            return current
+
+    first = next(iter_free_slots(doctor, now), None)
+    value = first[0] if first else None
+    if value != current:
+        # next_available_at có trong payload chi tiết bác sĩ nên đổi cả ETag hồ sơ
+        Doctor.objects.filter(pk=doctor_id).update(
+            next_available_at=value, profile_version=F("profile_version") + 1
+        )
+    return value
+
+
+_batch = threading.local()
+
+
+def schedule_changed(doctor_id, dates=None):
+    """
+    Gọi sau mọi thay đổi ảnh hưởng tới slot của bác sĩ (lịch hẹn, lịch làm việc, lịch nghỉ):
+    vô hiệu cache, cập nhật lại DoctorSlot cho các ngày bị ảnh hưởng và next_available_at.
+    Trong khối batched_schedule_changes() các lần gọi được gom lại đến cuối khối.
+    """
+    pending = getattr(_batch, "pending", None)
+    if pending is not None:
+        if dates is None or (doctor_id in pending and pending[doctor_id] is None):
+            pending[doctor_id] = None
+        else:
+            pending.setdefault(doctor_id, set()).update(dates)
+        return
+
+    # Ghi inventory trước rồi mới đổi version: nếu đổi version trước, request đọc xen giữa sẽ
+    # cache inventory cũ dưới key mới và giữ nó đến hết SLOT_CACHE_TIMEOUT
+    refresh_slot_inventory(doctor_id, dates)
+    bump_schedule_version(doctor_id)
+    refresh_next_available(doctor_id, dates)
+
+
+@contextmanager
+def batched_schedule_changes():
+    """Gom mọi schedule_changed() trong khối lệnh để mỗi bác sĩ chỉ được cập nhật một lần."""
+    if getattr(_batch, "pending", None) is not None:
+        yield
+        return
+
+    _batch.pending = {}
+    try:
+        yield
+        pending = _batch.pending
+    finally:
+        _batch.pending = None
+
+    for doctor_id, dates in pending.items():
+        schedule_changed(doctor_id, dates)
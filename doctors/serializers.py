@@ -1,7 +1,8 @@
 from rest_framework import serializers
-from .models import Doctor, DoctorAvailability, DoctorDayOff, Specialty
+from .models import Doctor, DoctorAvailability, DoctorDayOff, Specialty, Room
 from accounts.serializers import UserSerializer
 from appointments.models import Appointment
+from appointments.occupancy import room_move_conflicts
 from doctors.models import DoctorReview
 from media.utils import cloud_thumbs
 
@@ -10,6 +11,17 @@ class SpecialtySerializer(serializers.ModelSerializer):
         model = Specialty
         fields = "__all__"
 
+class RoomSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Room
+        fields = ["id", "code", "name", "is_active"]
+
+    def validate_code(self, value):
+        code = Room.normalize_code(value)
+        if not code:
+            raise serializers.ValidationError("Mã phòng không được để trống.")
+        return code
+
 class DoctorSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
@@ -44,9 +56,9 @@ class DoctorSerializer(serializers.ModelSerializer):
             "bio", "started_practice", "experience_years", "experience_detail",
             "average_rating",
             "profile_picture", "profile_picture_thumbs", 
-            "address", "room_number", "is_active"
+            "address", "room_number", "is_active", "next_available_at"
         ]
-        read_only_fields = ["id", "slug", "user", "profile_picture", "experience_years", "average_rating"]
+        read_only_fields = ["id", "slug", "user", "profile_picture", "experience_years", "average_rating", "next_available_at"]
 
     def get_profile_picture_thumbs(self, obj):
         if obj.profile_picture:
@@ -61,6 +73,11 @@ class DoctorSerializer(serializers.ModelSerializer):
             instance.profile_picture = None
         return super().update(instance, validated_data)
 
+    def validate_room_number(self, value):
+        if self.instance is not None and room_move_conflicts(self.instance, value):
+            raise serializers.ValidationError("Phòng này đang có lịch hẹn trùng giờ với lịch sắp tới của bác sĩ.")
+        return value
+
     def get_experience_years(self, obj):
         return obj.experience_years
 
@@ -73,7 +90,7 @@ class DoctorSerializer(serializers.ModelSerializer):
 class DoctorAvailabilitySerializer(serializers.ModelSerializer):
     class Meta:
         model = DoctorAvailability
-        fields = ['id','weekday','start_time','end_time','slot_minutes','is_active']
+        fields = ['id','weekday','start_time','end_time','slot_minutes','is_active','valid_from','valid_to']
 
     def validate(self, data):
         user = self.context['request'].user
@@ -90,15 +107,63 @@ class DoctorAvailabilitySerializer(serializers.ModelSerializer):
         if not start or not end or end <= start:
             raise serializers.ValidationError("end_time phải lớn hơn start_time.")
 
-        qs = DoctorAvailability.objects.filter(doctor=doctor, weekday=weekday, is_active=True)
+        valid_from = data.get('valid_from', getattr(self.instance, 'valid_from', None))
+        valid_to   = data.get('valid_to',   getattr(self.instance, 'valid_to', None))
+        if valid_from and valid_to and valid_to < valid_from:
+            raise serializers.ValidationError("valid_to phải lớn hơn hoặc bằng valid_from.")
+
+        # Một phiên bản lịch tuần thay cả tuần kể từ valid_from, nên một khung lẻ mở phiên bản mới
+        # sẽ xóa các ngày còn lại. Phiên bản mới chỉ được tạo qua PUT availability/week/.
+        siblings = DoctorAvailability.objects.filter(doctor=doctor)
         if self.instance:
-            qs = qs.exclude(pk=self.instance.pk)
+            siblings = siblings.exclude(pk=self.instance.pk)
+        new_version = valid_from and valid_from != getattr(self.instance, 'valid_from', None)
+        if new_version and not siblings.filter(valid_from=valid_from).exists():
+            raise serializers.ValidationError(
+                "Phiên bản lịch tuần mới (valid_from) phải được tạo cho cả tuần qua PUT availability/week/."
+            )
+
+        # Chỉ so trùng với các khung cùng phiên bản lịch tuần (cùng valid_from)
+        qs = siblings.filter(weekday=weekday, is_active=True, valid_from=valid_from)
 
         if qs.filter(start_time__lt=end, end_time__gt=start).exists():
             raise serializers.ValidationError("Khung giờ này đã trùng với lịch làm việc khác.")
 
         return data
     
+class AvailabilityWindowSerializer(serializers.Serializer):
+    weekday = serializers.IntegerField(min_value=0, max_value=6)
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    slot_minutes = serializers.IntegerField(min_value=1, max_value=24 * 60, default=30)
+    is_active = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        if data['end_time'] <= data['start_time']:
+            raise serializers.ValidationError("end_time phải lớn hơn start_time.")
+        return data
+
+class DoctorWeekSerializer(serializers.Serializer):
+    windows = AvailabilityWindowSerializer(many=True, allow_empty=True)
+    valid_from = serializers.DateField(required=False, allow_null=True, default=None)
+    valid_to = serializers.DateField(required=False, allow_null=True, default=None)
+    doctors = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all(), many=True, required=False)
+
+    def validate(self, data):
+        if data['valid_from'] and data['valid_to'] and data['valid_to'] < data['valid_from']:
+            raise serializers.ValidationError("valid_to phải lớn hơn hoặc bằng valid_from.")
+
+        # Kiểm tra trùng trong bộ nhớ: sắp xếp rồi so từng cặp liền kề
+        windows = sorted(data['windows'], key=lambda w: (w['weekday'], w['start_time']))
+        for prev, cur in zip(windows, windows[1:]):
+            if prev['weekday'] == cur['weekday'] and cur['start_time'] < prev['end_time']:
+                raise serializers.ValidationError(
+                    f"Khung giờ {cur['start_time']:%H:%M}-{cur['end_time']:%H:%M} (thứ {cur['weekday']}) "
+                    f"trùng với {prev['start_time']:%H:%M}-{prev['end_time']:%H:%M}."
+                )
+        data['windows'] = windows
+        return data
+
 class DoctorDayOffSerializer(serializers.ModelSerializer):
     class Meta:
         model = DoctorDayOff
@@ -0,0 +1,172 @@
+# doctors/signals.py
+from datetime import timedelta
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from appointments.models import Appointment, SlotHold
+from appointments.occupancy import rebuild_doctor_cells, sync_cells
+from .models import ClinicClosure, Doctor, DoctorAvailability, DoctorDayOff, DoctorReview, Specialty
+from .scheduling import clinic_closures_changed, refresh_next_available, schedule_changed
+
+
+def _local_dates(start_at, end_at):
+    if start_at is None or end_at is None:
+        return set()
+    d = timezone.localtime(start_at).date()
+    last = timezone.localtime(end_at).date()
+    dates = set()
+    while d <= last:
+        dates.add(d)
+        d += timedelta(days=1)
+    return dates
+
+
+def _appointment_snapshot(appt):
+    return (appt.doctor_id, appt.start_at, appt.end_at, appt.status, appt.room_id)
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    instance._slot_snapshot = _appointment_snapshot(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, "_slot_snapshot", None)
+    new = _appointment_snapshot(instance)
+
+    cancelled = Appointment.Status.CANCELLED
+    same_slot = (
+        not created and old is not None
+        and old[:3] == new[:3] and (old[3] == cancelled) == (new[3] == cancelled)
+    )
+    if same_slot and old[4] == new[4]:
+        return
+    # Ô thời gian là chốt chặn trùng lịch duy nhất nên được ghi ở đây cho mọi đường lưu (API, admin, shell).
+    # CellConflict lan ra khỏi save() và Appointment.save rollback cả dòng lịch hẹn.
+    sync_cells(instance)
+    instance._slot_snapshot = new
+    if same_slot:
+        return
+
+    if not created and old is not None:
+        if old[0] and old[0] != new[0]:
+            schedule_changed(old[0], _local_dates(old[1], old[2]))
+
+    if instance.doctor_id:
+        dates = _local_dates(instance.start_at, instance.end_at)
+        if old is not None and old[0] == new[0]:
+            dates |= _local_dates(old[1], old[2])
+        schedule_changed(instance.doctor_id, dates)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    if instance.doctor_id and instance.status != Appointment.Status.CANCELLED:
+        schedule_changed(instance.doctor_id, _local_dates(instance.start_at, instance.end_at))
+
+
+def _hold_changed(hold):
+    # Giữ chỗ không đổi slot đã cache (được lọc lúc đọc) nhưng có thể đổi next_available_at
+    transaction.on_commit(partial(refresh_next_available, hold.doctor_id, _local_dates(hold.start_at, hold.end_at)))
+
+
+@receiver(post_save, sender=SlotHold)
+def slot_hold_saved(sender, instance, created, **kwargs):
+    if created:
+        _hold_changed(instance)
+
+
+@receiver(post_delete, sender=SlotHold)
+def slot_hold_deleted(sender, instance, **kwargs):
+    _hold_changed(instance)
+
+
+@receiver(post_save, sender=DoctorAvailability)
+@receiver(post_delete, sender=DoctorAvailability)
+def availability_changed(sender, instance, **kwargs):
+    schedule_changed(instance.doctor_id)
+
+
+@receiver(post_init, sender=DoctorDayOff)
+def remember_day_off_date(sender, instance, **kwargs):
+    instance._slot_snapshot = instance.date
+
+
+@receiver(post_save, sender=DoctorDayOff)
+@receiver(post_delete, sender=DoctorDayOff)
+def day_off_changed(sender, instance, **kwargs):
+    dates = {instance.date}
+    if getattr(instance, "_slot_snapshot", None):
+        dates.add(instance._slot_snapshot)
+    instance._slot_snapshot = instance.date
+    schedule_changed(instance.doctor_id, dates)
+
+
+@receiver(post_init, sender=ClinicClosure)
+def remember_closure_date(sender, instance, **kwargs):
+    instance._slot_snapshot = instance.date
+
+
+@receiver(post_save, sender=ClinicClosure)
+def closure_saved(sender, instance, **kwargs):
+    dates = {instance.date}
+    if getattr(instance, "_slot_snapshot", None):
+        dates.add(instance._slot_snapshot)
+    instance._slot_snapshot = instance.date
+    clinic_closures_changed(dates)
+
+
+@receiver(post_delete, sender=ClinicClosure)
+def closure_deleted(sender, instance, **kwargs):
+    clinic_closures_changed({instance.date})
+
+
+def _bump_profile(**filters):
+    # ETag của trang chi tiết bác sĩ dựa trên profile_version
+    Doctor.objects.filter(**filters).update(profile_version=F("profile_version") + 1)
+
+
+@receiver(post_init, sender=Doctor)
+def remember_doctor_buffer(sender, instance, **kwargs):
+    instance._buffer_snapshot = instance.buffer_minutes
+    instance._room_snapshot = instance.room_id
+
+
+@receiver(post_save, sender=Doctor)
+def doctor_saved(sender, instance, created, **kwargs):
+    _bump_profile(pk=instance.pk)
+    if not created:
+        buffer_changed = instance._buffer_snapshot != instance.buffer_minutes
+        room_changed = instance._room_snapshot != instance.room_id
+        # Đổi phòng: các lịch hẹn sắp tới đi theo bác sĩ sang phòng mới cùng với ô của chúng
+        if buffer_changed or room_changed:
+            rebuild_doctor_cells(instance, move_room=room_changed)
+        # Buffer thay đổi làm thay đổi toàn bộ slot trống của bác sĩ
+        if buffer_changed:
+            schedule_changed(instance.pk)
+    instance._buffer_snapshot = instance.buffer_minutes
+    instance._room_snapshot = instance.room_id
+
+
+@receiver(post_save, sender=CustomUser)
+def doctor_user_saved(sender, instance, **kwargs):
+    if instance.role == "DOCTOR":
+        _bump_profile(user_id=instance.pk)
+
+
+@receiver(post_save, sender=Specialty)
+def specialty_saved(sender, instance, **kwargs):
+    _bump_profile(specialty_id=instance.pk)
+
+
+@receiver(post_save, sender=DoctorReview)
+@receiver(post_delete, sender=DoctorReview)
+def review_changed(sender, instance, **kwargs):
+    _bump_profile(pk=instance.doctor_id)
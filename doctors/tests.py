@@ -1,3 +1,138 @@
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from appointments.models import Appointment
+from patients.models import Patient
+from .models import Doctor, DoctorAvailability, DoctorDayOff
+from .scheduling import DayGrid, bump_schedule_version, free_slots, slot_cache_key, slot_cache_stats
+
+
+class DayGridTests(TestCase):
+    def setUp(self):
+        # 08:00-12:00, lưới 30 phút; bận 08:30-09:00, nghỉ 10:00-10:15
+        mask = DayGrid.mask
+        self.grid = DayGrid(
+            timezone.localdate(), windows=[(480, 720, 30)],
+            work=mask(480, 720), off=mask(600, 615), busy=mask(510, 540),
+        )
+
+    def test_mask(self):
+        self.assertEqual(DayGrid.mask(2, 5), 0b11100)
+        self.assertEqual(DayGrid.mask(5, 5), 0)
+        self.assertEqual(DayGrid.mask(-10, 2), 0b11)
+        self.assertEqual(DayGrid.mask(DayGrid.MINUTES - 1, DayGrid.MINUTES + 10), 1 << (DayGrid.MINUTES - 1))
+
+    def test_slots(self):
+        self.assertEqual(self.grid.slots(), [(480, 510), (540, 570), (570, 600), (630, 660), (660, 690), (690, 720)])
+
+    def test_runs(self):
+        self.assertEqual(self.grid.runs(60), [(540, 600), (630, 690), (660, 720)])
+        self.assertEqual(self.grid.runs(30), self.grid.slots())
+        self.assertEqual(self.grid.runs(45), [])
+        self.assertEqual(self.grid.runs(0), [])
+
+    def test_free_slot_count_matches_slots(self):
+        self.assertEqual(self.grid.free_slot_count(), len(self.grid.slots()))
+        # Slot 08:00 và 08:30 đã qua; slot 09:00 đang diễn ra vẫn được đếm
+        self.assertEqual(self.grid.free_slot_count(now_min=560), 5)
+        self.assertEqual(self.grid.free_slot_count(now_min=24 * 60), 0)
+
+    def test_full_day_off(self):
+        self.grid.full_day_off = True
+        self.assertEqual(self.grid.slots(), [])
+        self.assertEqual(self.grid.runs(30), [])
+        self.assertEqual(self.grid.free_slot_count(), 0)
+
+    def test_bytes_round_trip(self):
+        data = self.grid.to_bytes()
+        copy = DayGrid.from_bytes(data)
+        self.assertEqual(copy.date, self.grid.date)
+        self.assertEqual(copy.windows, [(480, 720, 30)])
+        self.assertEqual((copy.work, copy.off, copy.busy), (self.grid.work, self.grid.off, self.grid.busy))
+        self.assertFalse(copy.full_day_off)
+        self.assertEqual(copy.slots(), self.grid.slots())
+
+        self.grid.full_day_off = True
+        self.assertTrue(DayGrid.from_bytes(self.grid.to_bytes()).full_day_off)
+
+
+class SlotCacheTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            email="bacsi@example.com", password="x", full_name="Bac Si Cache", role="DOCTOR"
+        )
+        self.doctor = Doctor.objects.create(user=user)
+        for weekday in range(7):
+            DoctorAvailability.objects.create(
+                doctor=self.doctor, weekday=weekday, start_time=time(8), end_time=time(12), slot_minutes=30
+            )
+        self.doctor.refresh_from_db()
+        patient_user = CustomUser.objects.create_user(
+            email="benhnhan@example.com", password="x", full_name="Benh Nhan", role="PATIENT"
+        )
+        self.patient = Patient.objects.create(user=patient_user)
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.url = f"/api/doctors/{self.doctor.slug}/slots/?date={self.day}"
+        # Cache khóa theo pk bác sĩ (pk được dùng lại giữa các test) và đã được làm nóng khi tạo lịch làm việc
+        cache.clear()
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def slot_count(self):
+        return len(free_slots(self.doctor, self.day, self.day)[0][1])
+
+    def test_slots_cached_under_schedule_version(self):
+        self.assertEqual(self.slot_count(), 8)
+        key = slot_cache_key(self.doctor, self.day)
+        self.assertEqual(len(cache.get(key)), 8)
+
+        bump_schedule_version(self.doctor.pk)
+        self.doctor.refresh_from_db()
+        self.assertNotEqual(slot_cache_key(self.doctor, self.day), key)
+
+    def test_schedule_changes_invalidate_cached_slots(self):
+        self.assertEqual(self.slot_count(), 8)
+
+        DoctorDayOff.objects.create(doctor=self.doctor, date=self.day, start_time=time(9), end_time=time(10))
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.slot_count(), 6)
+
+        Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, start_at=self.at(8), end_at=self.at(8, 30)
+        )
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.slot_count(), 5)
+
+    def test_cache_stats_count_public_reads(self):
+        free_slots(self.doctor, self.day, self.day, count_stats=True)
+        free_slots(self.doctor, self.day, self.day, count_stats=True)
+        free_slots(self.doctor, self.day, self.day)
+        stats = slot_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_slots_etag_and_not_modified(self):
+        client = APIClient()
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(len(response.data[0]["slots"]), 8)
+
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_schedule_change_changes_etag(self):
+        client = APIClient()
+        etag = client.get(self.url)["ETag"]
 
-# Create your tests here.
+        DoctorDayOff.objects.create(doctor=self.doctor, date=self.day, start_time=time(9), end_time=time(10))
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data[0]["slots"]), 6)
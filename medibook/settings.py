@@ -167,8 +167,45 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Số phút nghỉ giữa hai lịch hẹn, áp dụng cho bác sĩ không đặt Doctor.buffer_minutes.
+# Sau khi đổi giá trị cần chạy rebuild_slot_inventory để slot trống, ô buffer của lịch đã đặt (AppointmentCell)
+# và cache tính lại theo buffer mới.
 APPOINTMENT_BUFFER_MINUTES = 0
 
+# Độ dài một ô trong bảng AppointmentCell. Nên là ước của slot_minutes, giờ bắt đầu khung làm việc
+# và buffer để ô khớp đúng lịch hẹn (nếu không, ô được làm tròn ra ngoài nên chỉ chặn dư chứ không sót)
+APPOINTMENT_CELL_MINUTES = 5
+
+# Thời gian giữ chỗ (POST /api/appointments/holds/) trước khi khung giờ được nhả
+SLOT_HOLD_MINUTES = 5
+
+# Khóa tùy chọn khi đặt lịch, thêm trên ô AppointmentCell: "none" (mặc định, chỉ dựa vào ràng buộc unique),
+# "row" (SELECT ... FOR UPDATE dòng Doctor/Room), "mysql" (GET_LOCK), "local" (threading.Lock, chỉ cho dev/test)
+# hoặc đường dẫn tới class backend. Bật khi nhiều lượt đặt cùng bác sĩ hay đụng nhau (lỗi trùng/deadlock).
+APPOINTMENT_LOCK_BACKEND = os.getenv("APPOINTMENT_LOCK_BACKEND", "none")
+APPOINTMENT_LOCK_TIMEOUT = 10  # giây
+
+# Khi khung giờ bị trùng, trả về tối đa N slot trống gần nhất của bác sĩ
+# (và của tối đa M bác sĩ cùng chuyên khoa nếu client yêu cầu)
+BOOKING_ALTERNATIVES = 3
+BOOKING_ALTERNATIVE_DOCTORS = 5
+
+# Số ngày (tính từ hôm nay) được lưu sẵn trong bảng DoctorSlot
+SLOT_INVENTORY_DAYS = 60
+
+# Cache slot theo (bác sĩ, schedule_version, ngày). Nên dùng cache dùng chung (Redis/Memcached)
+# khi chạy nhiều worker để bộ đếm hit/miss phản ánh toàn hệ thống.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "medibook"),
+    }
+}
+SLOT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Khoảng ngày tối đa cho một lần truy vấn slot (kể cả chế độ ?stream=1)
+SLOTS_MAX_RANGE_DAYS = 92
+
 CLOUDINARY_URL = os.getenv("CLOUDINARY_URL")
 
 STORAGES = {
@@ -18,6 +18,25 @@ const makeSlotLabel = (start, end) => {
         e = new Date(end);
     return `${pad2(s.getHours())}:${pad2(s.getMinutes())}–${pad2(e.getHours())}:${pad2(e.getMinutes())}`;
 };
+// Giải nén ?format=compact: bit i của mask (bit cao trước) = slot origin + i * slot_minutes còn trống
+const expandCompactSlots = (grids) => {
+    const slots = [];
+    grids.forEach(({ origin, slot_minutes, mask }) => {
+        const offset = origin.slice(19);
+        const sign = offset[0] === "-" ? -1 : 1;
+        const offsetMs = sign * (Number(offset.slice(1, 3)) * 60 + Number(offset.slice(4, 6))) * 60000;
+        const base = Date.parse(origin) + offsetMs;
+        const toIso = (ms) => new Date(ms).toISOString().slice(0, 19) + offset;
+        const bytes = atob(mask);
+        for (let i = 0; i < bytes.length * 8; i++) {
+            if (bytes.charCodeAt(i >> 3) & (0x80 >> (i & 7))) {
+                const start = base + i * slot_minutes * 60000;
+                slots.push({ start_at: toIso(start), end_at: toIso(start + slot_minutes * 60000) });
+            }
+        }
+    });
+    return slots;
+};
 const formatDateTitle = (dateString) => {
     const days = ["Chủ Nhật", "Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy"];
     const today = new Date();
@@ -178,14 +197,14 @@ async function loadDoctorSlots(slug) {
 
     try {
         dateList.innerHTML = `<p class="abk-empty">Đang tải lịch khám...</p>`;
-        const res = await fetch(`/api/doctors/${slug}/slots/?start=${start}&end=${end}`);
+        const res = await fetch(`/api/doctors/${slug}/slots/?start=${start}&end=${end}&format=compact`);
         if (!res.ok) throw new Error();
         const data = await res.json();
 
         state.days = data
             .map((day) => ({
                 id: day.date,
-                slots: day.slots
+                slots: expandCompactSlots(day.grids)
                     .filter((s) => new Date(s.start_at) >= new Date())
                     .map((s) => ({
                         label: makeSlotLabel(s.start_at, s.end_at),
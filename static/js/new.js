@@ -12,6 +12,26 @@ document.addEventListener("DOMContentLoaded", function () {
         return `${pad2(sh)}:${pad2(sm)}–${pad2(eh)}:${pad2(em)}`;
     };
 
+    // Giải nén ?format=compact: bit i của mask (bit cao trước) = slot origin + i * slot_minutes còn trống
+    const expandCompactSlots = (grids) => {
+        const slots = [];
+        grids.forEach(({ origin, slot_minutes, mask }) => {
+            const offset = origin.slice(19);
+            const sign = offset[0] === "-" ? -1 : 1;
+            const offsetMs = sign * (Number(offset.slice(1, 3)) * 60 + Number(offset.slice(4, 6))) * 60000;
+            const base = Date.parse(origin) + offsetMs;
+            const toIso = (ms) => new Date(ms).toISOString().slice(0, 19) + offset;
+            const bytes = atob(mask);
+            for (let i = 0; i < bytes.length * 8; i++) {
+                if (bytes.charCodeAt(i >> 3) & (0x80 >> (i & 7))) {
+                    const start = base + i * slot_minutes * 60000;
+                    slots.push({ start_at: toIso(start), end_at: toIso(start + slot_minutes * 60000) });
+                }
+            }
+        });
+        return slots;
+    };
+
     const formatDateTitle = (dateString) => {
         const daysOfWeek = ["Chủ Nhật", "Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy"];
         const today = new Date();
@@ -68,6 +88,7 @@ document.addEventListener("DOMContentLoaded", function () {
         selectedSlotLabel: null,
         selectedSlotStart: null,
         selectedSlotEnd: null,
+        holdToken: null,
         uploadedFiles: [],
         days: [],
     };
@@ -146,7 +167,7 @@ document.addEventListener("DOMContentLoaded", function () {
         try {
             dom.dateList.innerHTML = `<p class="abk-empty">Đang tải lịch khám...</p>`;
 
-            const response = await fetch(`/api/doctors/${doctorSlug}/slots/?start=${startDate}&end=${endDate}`, {
+            const response = await fetch(`/api/doctors/${doctorSlug}/slots/?start=${startDate}&end=${endDate}&format=compact`, {
                 headers: headers,
             });
 
@@ -163,7 +184,7 @@ document.addEventListener("DOMContentLoaded", function () {
             state.days = data
                 .map((day) => ({
                     id: day.date,
-                    slots: day.slots
+                    slots: expandCompactSlots(day.grids)
                         .filter((slot) => new Date(slot.start_at) >= new Date())
                         .map((slot) => ({
                             label: makeSlotLabel(slot.start_at, slot.end_at),
@@ -187,6 +208,42 @@ document.addEventListener("DOMContentLoaded", function () {
     }
     //endregion
 
+    // Giữ chỗ khung giờ đã chọn trong lúc điền form để bệnh nhân khác không đặt mất
+    async function holdSelectedSlot() {
+        state.holdToken = null;
+        if (!window.isAuthenticated || !token || !state.selectedSlotStart) return;
+
+        try {
+            const response = await fetch("/api/appointments/holds/", {
+                method: "POST",
+                headers: {
+                    Authorization: `Bearer ${token}`,
+                    "Content-Type": "application/json",
+                },
+                body: JSON.stringify({
+                    doctor: doctorId,
+                    start_at: state.selectedSlotStart,
+                    end_at: state.selectedSlotEnd,
+                }),
+            });
+
+            if (response.ok) {
+                state.holdToken = (await response.json()).token;
+            } else if (response.status === 400) {
+                showToast("Khung giờ này vừa có người giữ hoặc đặt. Vui lòng chọn giờ khác.", "error");
+                state.selectedSlotLabel = null;
+                state.selectedSlotStart = null;
+                state.selectedSlotEnd = null;
+                await fetchSlots();
+                renderDates();
+                renderSlots();
+                updateSidebar();
+            }
+        } catch (error) {
+            console.error("Error holding slot:", error);
+        }
+    }
+
     //region - Render Functions
     const renderStepper = () => {
         const steps = [
@@ -328,6 +385,7 @@ document.addEventListener("DOMContentLoaded", function () {
                     renderSlots();
                     updateSidebar();
                     toggleAccordion(2); // Move to patient info step
+                    holdSelectedSlot();
                     if (notes) {
                         dom.notesInput.value = decodeURIComponent(notes);
                     }
@@ -361,6 +419,7 @@ document.addEventListener("DOMContentLoaded", function () {
             renderSlots();
             updateSidebar();
             toggleAccordion(2);
+            holdSelectedSlot();
         }
     };
 
@@ -425,6 +484,7 @@ document.addEventListener("DOMContentLoaded", function () {
                     start_at: state.selectedSlotStart,
                     end_at: state.selectedSlotEnd,
                     note: dom.notesInput.value,
+                    hold_token: state.holdToken || "",
                 }),
             });
 